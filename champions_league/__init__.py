@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Champions League Draw Algorithm
+
+@author: Sreejith
+
+Importing the package does no work: each name below is only imported from its
+submodule when first used, numpy when a draw needs random numbers and pandas
+when DataFrames go in or come out. Simulations are run from the command line,
+see `python -m champions_league --help`.
+"""
+
+# public names and the submodule each one lives in
+EXPORTS = {
+    'STANDINGS': 'standings',
+    'group_2021_df': 'standings',
+    'group_2020_df': 'standings',
+    'league_phase_playoff': 'standings',
+    'synthetic_standings': 'standings',
+    'check_standings': 'seasons',
+    'read_standings': 'seasons',
+    'load_seasons': 'seasons',
+    'Bracket': 'bracket',
+    'compile_bracket': 'bracket',
+    'bracket_arrays': 'bracket',
+    'bracket_from_arrays': 'bracket',
+    'eligible_mask': 'bracket',
+    'eligible_clubs': 'bracket',
+    'can_complete': 'bracket',
+    'Matching': 'bracket',
+    'max_matching': 'bracket',
+    'matching_count': 'bracket',
+    'DrawError': 'draw',
+    'DrawState': 'draw',
+    'DRAW_FUNCTIONS': 'draw',
+    'draw_rng': 'draw',
+    'PROCEDURES': 'draw',
+    'draw_clubs': 'draw',
+    'draw_clubs_country': 'draw',
+    'draw_clubs_country_alt': 'draw',
+    'draw_clubs_order': 'draw',
+    'draw_clubs_lookahead': 'draw',
+    'draw_clubs_uniform': 'draw',
+    'BatchDraws': 'batch',
+    'draw_batch': 'batch',
+    'pairing_counts': 'batch',
+    'DrawProbabilities': 'exact',
+    'draw_probabilities': 'exact',
+    'uniform_probabilities': 'exact',
+    'DrawBias': 'exact',
+    'draw_bias': 'exact',
+    'SimulationCounts': 'parallel',
+    'simulate_draws': 'parallel',
+    'DrawResult': 'stream',
+    'DrawAggregator': 'stream',
+    'iter_draws': 'stream',
+    'simulate_until': 'stream',
+    'ProcedureComparison': 'compare',
+    'PairedDifference': 'compare',
+    'compare_procedures': 'compare',
+    'RareEstimate': 'rare',
+    'estimate_invalid': 'rare',
+    'RULES': 'rules',
+    'compile_rules': 'rules',
+    'VariantReport': 'rules',
+    'compare_variants': 'rules',
+    'DrawStore': 'store',
+    'store_draws': 'store',
+    'pair_frequency': 'store',
+    'conditional_frequency': 'store',
+    'Scenario': 'scenarios',
+    'ScenarioSweep': 'scenarios',
+    'canonical_form': 'scenarios',
+    'sweep_scenarios': 'scenarios',
+    'LiveDraw': 'live',
+    'LiveDrawService': 'live',
+    'DrawTrace': 'instrument',
+    'tracing': 'instrument',
+    'run_benchmarks': 'bench',
+    'find_regressions': 'bench'}
+
+__all__ = list(EXPORTS)
+
+
+def __getattr__(name):
+    if name not in EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    from importlib import import_module
+
+    value = getattr(import_module('.' + EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
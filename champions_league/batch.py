@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""
+Champions League Draw Algorithm - batch draws
+
+@author: Sreejith
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from . import instrument
+from .bracket import compile_bracket
+from .draw import PROCEDURES
+from .endgame import endgame
+
+
+# batch draws
+# runs many independent draws in lockstep with numpy, so that invalid-draw rates
+# and pairing frequencies can be estimated from millions of draws:
+# - the state of every draw is a pair of masks (winners and runners up unchosen)
+# - every random pick takes the k-th set bit of a mask, with k drawn uniformly,
+#   which is the same as np.random.choice over the clubs in the mask
+# - each procedure follows the same steps (1A/1B/1C, eligible opponent,
+#   difficulty ordering) as the draw function it is named after
+# - uniforms optionally gives the random numbers of every draw as one key per
+#   club, (n, matches, 2, m): in match k of draw i, every pick takes the club
+#   with the smallest key out of those it picks from, uniforms[i, k, 0] being
+#   the keys of the winners and uniforms[i, k, 1] those of the runners up
+#   (the uniform draw weights the keys by exponential race), so several
+#   procedures can be run on the same numbers and pick the same club whenever
+#   it is a candidate for both (the order draw still shuffles its matches with
+#   rng)
+#
+# draw_batch returns a BatchDraws tuple:
+# - winner, runner: (n, matches) int8 codes of the clubs drawn in each match,
+#   -1 from the match where the draw got stuck
+# - invalid: True when the draw got stuck (the draw function raised ValueError)
+# - stuck: number of matches drawn when the draw got stuck, -1 for valid draws
+BatchDraws = namedtuple('BatchDraws', ['winner', 'runner', 'invalid', 'stuck'])
+
+# the batch and exact engines keep tables over every state (4 ** m of them),
+# larger brackets are drawn with the draw functions
+DENSE_MAX_RUNNERS = 10
+
+bit_tables_cache = {}
+
+
+# popcount and k-th set bit of every mask of m bits (-1 past the last set bit)
+def bit_tables(m):
+    if m not in bit_tables_cache:
+        masks = np.arange(1 << m)
+        bits = (masks[:, None] >> np.arange(m)) & 1
+        popcount = bits.sum(1)
+
+        select = np.full((1 << m, m), -1, dtype=np.int64)
+        rank = np.cumsum(bits, 1) - 1
+        rows, cols = np.nonzero(bits)
+        select[rows, rank[rows, cols]] = cols
+
+        bit_tables_cache[m] = (popcount, select)
+
+    return bit_tables_cache[m]
+
+
+# number of ways each state (numbered winners_left << m | runners_left) can
+# be completed, the batch version of matching_count: the count of a state adds
+# up the counts of the states left by pairing its first runner up left
+def matching_counts(bracket):
+    if bracket.matching_states is not None:
+        return bracket.matching_states
+
+    m = len(bracket.runners)
+    popcount, select = bit_tables(m)
+    club_bits = 1 << np.arange(m)
+    runner_ok = np.array(bracket.runner_ok, dtype=np.int64)
+
+    states = np.arange(1 << 2 * m)
+    winners_left = states >> m
+    runners_left = states & bracket.all_runners
+    runners_n = popcount[runners_left]
+
+    counts = np.zeros(states.size, dtype=np.int64)
+    counts[0] = 1
+    for n in range(1, m + 1):
+        layer = states[(runners_n == n) & (popcount[winners_left] == n)]
+        r = select[runners_left[layer], 0]
+        ok = (winners_left[layer, None] & runner_ok[r][:, None] & club_bits) != 0
+        states_next = np.where(ok, layer[:, None] - (club_bits << m) - (1 << r)[:, None], 0)
+        counts[layer] = (ok * counts[states_next]).sum(1)
+
+    bracket.matching_states = counts
+
+    return counts
+
+
+# whether each state can still be completed, the batch version of can_complete
+def matching_table(bracket):
+    return matching_counts(bracket) > 0
+
+
+# eligible winners of each runner up that leave a complete state
+def lookahead_ok(complete, m, winners_left, runners_left, ok_winners):
+    club_bits = 1 << np.arange(m)
+    ok = (ok_winners[..., None] & club_bits) != 0
+    states_next = (((winners_left[..., None] & ~club_bits) << m) |
+                   runners_left[..., None])
+
+    return ((ok & complete[np.where(ok, states_next, 0)]) * club_bits).sum(-1)
+
+
+# number of ways the draw can be completed after pairing each eligible winner,
+# (..., m) weights for the uniform draw
+def uniform_weights(counts, m, winners_left, runners_left, ok_winners):
+    club_bits = 1 << np.arange(m)
+    ok = (ok_winners[..., None] & club_bits) != 0
+    states_next = (((winners_left[..., None] & ~club_bits) << m) |
+                   runners_left[..., None])
+
+    return ok * counts[np.where(ok, states_next, 0)]
+
+
+# pick one set bit of every mask, u holds one uniform number per mask
+def choice_bits(masks, u, popcount, select):
+    k = (u * popcount[masks]).astype(np.int64)
+
+    return select[masks, k]
+
+
+# pick the set bit of every mask with the smallest key, keys holding one
+# uniform number per bit
+def key_bits(masks, keys):
+    bits = (masks[:, None] >> np.arange(keys.shape[1])) & 1
+
+    return np.where(bits, keys, 2).argmin(1)
+
+
+# pick one bit of every row with probability proportional to its weight, by
+# exponential race over its key
+def key_weighted(weights, keys):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        race = np.where(weights > 0, -np.log1p(-keys) / weights, np.inf)
+
+    return race.argmin(1)
+
+
+def draw_batch(last16_df, n, procedure='random', rng=None, chunk_size=1 << 17,
+               uniforms=None):
+    if procedure not in PROCEDURES:
+        raise ValueError("Unknown draw procedure: " + str(procedure))
+
+    bracket = compile_bracket(last16_df)
+    m = len(bracket.runners)
+    if len(bracket.winners) != m:
+        raise ValueError("Batch draws need as many winners as runners up")
+    if m > DENSE_MAX_RUNNERS:
+        raise ValueError("Batch draws need at most " + str(DENSE_MAX_RUNNERS) +
+                         " runners up")
+    if (uniforms is not None) and (np.shape(uniforms) != (n, m, 2, m)):
+        raise ValueError("Batch uniforms need the shape (draws, matches, 2, clubs)")
+    if rng is None:
+        rng = np.random.default_rng()
+
+    trace = instrument.active
+    chunks = []
+    for start in range(0, n, chunk_size):
+        if trace is not None:
+            chunk_start = trace.clock()
+        chunks.append(draw_batch_chunk(
+            bracket, min(chunk_size, n - start), procedure, rng,
+            None if uniforms is None else uniforms[start:start + chunk_size]))
+        if trace is not None:
+            invalid = int(chunks[-1][2].sum())
+            trace.counters['draws'] += chunks[-1][2].size
+            trace.counters['invalid'] += invalid
+            trace.phase('batch', chunk_start, {'procedure': procedure,
+                                               'draws': chunks[-1][2].size,
+                                               'invalid': invalid})
+
+    return BatchDraws(*[np.concatenate(field) for field in zip(*chunks)])
+
+
+# 1 - first club of the next match (k matches already drawn), for a batch of
+# draw states, returns the finish of the club and the masks to pick it from
+def first_candidates(bracket, procedure, k, winners_left, runners_left):
+    m = len(bracket.runners)
+    popcount = bit_tables(m)[0]
+    club_bits = 1 << np.arange(m)
+
+    # odd matches of the alternating draw start with a winner
+    if (procedure == 'country_alt') & (k % 2 == 1):
+        finish, clubs_left, priority = 1, winners_left, bracket.priority_winners
+    else:
+        finish, clubs_left, priority = 2, runners_left, bracket.priority_runners
+
+    if procedure in ('random', 'lookahead', 'uniform'):
+        candidates = clubs_left
+    elif procedure == 'order':
+        # runners up with the fewest eligible teams
+        eli_clubs = popcount[winners_left[:, None] &
+                             np.array(bracket.runner_ok, dtype=np.int64)]
+        left = (runners_left[:, None] & club_bits) != 0
+        eli_left = np.where(left, eli_clubs, m + 1)
+        eli_club_i = eli_left.min(1)
+        candidates = ((eli_left == eli_club_i[:, None]) * club_bits).sum(1)
+    else:
+        # 1A/1B - priority countries first
+        candidates = np.where(clubs_left & priority,
+                              clubs_left & priority, clubs_left)
+
+    if (procedure not in ('random', 'lookahead', 'uniform')) & (k == m - 2):
+        # 1C - last four clubs
+        clubs_last = endgame_table(bracket)[finish - 1][
+            winners_left << m | runners_left]
+        candidates = np.where(clubs_last != 0, clubs_last, candidates)
+
+    return finish, candidates
+
+
+def draw_batch_chunk(bracket, n, procedure, rng, uniforms=None):
+    # initialise
+    m = len(bracket.runners)
+    popcount, select = bit_tables(m)
+    club_bits = 1 << np.arange(m)
+
+    runner_ok = np.array(bracket.runner_ok, dtype=np.int64)
+    winner_ok = np.array(bracket.winner_ok, dtype=np.int64)
+
+    winners_left = np.full(n, bracket.all_winners, dtype=np.int64)
+    runners_left = np.full(n, bracket.all_runners, dtype=np.int64)
+
+    winner = np.full((n, m), -1, dtype=np.int8)
+    runner = np.full((n, m), -1, dtype=np.int8)
+    invalid = np.zeros(n, dtype=bool)
+    stuck = np.full(n, -1, dtype=np.int8)
+
+    if procedure == 'order':
+        # 0 - order runner up by "difficulty" (number of eligible teams)
+        eli_clubs = popcount[winners_left[:, None] & runner_ok]
+        invalid |= (eli_clubs == 0).any(1)
+        stuck[invalid] = 0
+
+    if procedure in ('lookahead', 'uniform'):
+        complete = matching_table(bracket)
+    if procedure == 'uniform':
+        counts = matching_counts(bracket)
+
+    for k in range(m):
+        active = ~invalid
+        if uniforms is None:
+            u = rng.random((n, 2))
+
+        # 1 - pick the first club of the match
+        finish, candidates = first_candidates(
+            bracket, procedure, k, winners_left, runners_left)
+        if uniforms is None:
+            first = choice_bits(candidates, u[:, 0], popcount, select)
+        else:
+            first = key_bits(candidates, uniforms[:, k, finish - 1])
+        first = np.where(active, first, 0)
+
+        # 2 - select from eligible opponents
+        if finish == 2:
+            runners_left = np.where(active, runners_left & ~(1 << first), runners_left)
+            ok = winners_left & runner_ok[first]
+        else:
+            winners_left = np.where(active, winners_left & ~(1 << first), winners_left)
+            ok = runners_left & winner_ok[first]
+
+        if procedure in ('lookahead', 'uniform'):
+            ok = lookahead_ok(complete, m, winners_left, runners_left, ok)
+
+        stuck_now = active & (ok == 0)
+        invalid |= stuck_now
+        stuck[stuck_now] = k
+        active &= ~stuck_now
+
+        keys = None if uniforms is None else uniforms[:, k, 2 - finish]
+        if procedure == 'uniform':
+            # weighted by the number of valid draws left
+            weights = uniform_weights(counts, m, winners_left, runners_left, ok)
+            if keys is None:
+                weights = weights.cumsum(1)
+                second = (weights <= u[:, 1:] * weights[:, -1:]).sum(1)
+            else:
+                second = key_weighted(weights, keys)
+        elif keys is None:
+            second = choice_bits(ok, u[:, 1], popcount, select)
+        else:
+            second = key_bits(ok, keys)
+        second = np.where(active, second, 0)
+        if finish == 2:
+            winners_left = np.where(active, winners_left & ~(1 << second), winners_left)
+            winner[active, k] = second[active]
+            runner[active, k] = first[active]
+        else:
+            runners_left = np.where(active, runners_left & ~(1 << second), runners_left)
+            winner[active, k] = first[active]
+            runner[active, k] = second[active]
+
+        if procedure == 'order':
+            # re-score the remaining runners up
+            eli_clubs = popcount[winners_left[:, None] & runner_ok]
+            left = (runners_left[:, None] & club_bits) != 0
+            stuck_now = active & ((eli_clubs == 0) & left).any(1)
+            invalid |= stuck_now
+            stuck[stuck_now] = k
+            winner[stuck_now, k] = -1
+            runner[stuck_now, k] = -1
+
+    if procedure == 'order':
+        # 3 - randomise match number
+        order = np.argsort(rng.random((n, m)), axis=1)
+        valid = ~invalid
+        winner[valid] = np.take_along_axis(winner[valid], order[valid], 1)
+        runner[valid] = np.take_along_axis(runner[valid], order[valid], 1)
+
+    return winner, runner, invalid, stuck
+
+
+# number of valid draws pairing each winner (rows) with each runner up (columns)
+def pairing_counts(draws, m):
+    valid = ~draws.invalid
+    pairs = (draws.winner[valid].astype(np.int64) * m +
+             draws.runner[valid]).ravel()
+
+    return np.bincount(pairs, minlength=m * m).reshape(m, m)
+
+
+# 1C picks of every bracket state with two winners and two runners up left, as
+# a (finish, state) table for the batch engines, states being numbered
+# winners_left << m | runners_left
+def endgame_table(bracket):
+    if bracket.endgame_states is None:
+        m = len(bracket.runners)
+        popcount = bit_tables(m)[0]
+        states = np.arange(1 << 2 * m)
+        last4 = states[(popcount[states >> m] == 2) &
+                       (popcount[states & bracket.all_runners] == 2)]
+
+        table = np.zeros((2, states.size), dtype=np.int64)
+        for state in last4.tolist():
+            last4_state = endgame(bracket, state >> m, state & bracket.all_runners)
+            table[0, state] = last4_state.winners
+            table[1, state] = last4_state.runners
+        bracket.endgame_states = table
+
+    return bracket.endgame_states
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Champions League Draw Algorithm - benchmarks
+
+@author: Sreejith
+"""
+
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from .bracket import compile_bracket
+from .draw import DRAW_FUNCTIONS, DrawError
+from .instrument import tracing
+from .standings import STANDINGS, synthetic_standings
+
+
+# benchmarks
+# runs each draw function on each set of standings and measures, per draw:
+# - draws_per_s: draws per second over the timed draws
+# - latency_p50_us, latency_p99_us: median and 99th percentile time of a draw
+# - peak_bytes: mean and max peak memory allocated by a draw (tracemalloc)
+# - eligibility_calls: mean number of eligibility checks (eligible_mask calls,
+#   the compiled form of eligible_clubs)
+# - invalid_rate: fraction of draws that got stuck
+# timing, memory and eligibility counts are separate passes, so that
+# tracemalloc and the trace do not slow the timed draws down
+#
+# the standings are compiled once per benchmark, the draws start from the
+# compiled bracket as they would in a long running service
+BENCH_STANDINGS = ('2021', '2020', 'worst')
+
+# scaling benchmarks run the same measures on synthetic standings of 8 to 128
+# groups (16 to 256 clubs), named 'synthetic_<groups>', with every procedure
+# but the uniform draw, which only takes brackets of up to UNIFORM_MAX_RUNNERS
+# runners up
+SCALING_GROUPS = (8, 16, 32, 64, 128)
+SCALING_PROCEDURES = tuple(p for p in DRAW_FUNCTIONS if p != 'uniform')
+
+
+def scaling_standings(groups=SCALING_GROUPS, seed=0):
+    return {'synthetic_' + str(g): synthetic_standings(g, seed=seed)
+            for g in groups}
+
+
+def bench_draws(bracket, draw, n, rng, memory_n=1000):
+    invalid = 0
+    times = np.empty(n, dtype=np.int64)
+    for i in range(n):
+        start = time.perf_counter_ns()
+        try:
+            draw(bracket, rng=rng, as_frame=False)
+        except DrawError:
+            invalid += 1
+        times[i] = time.perf_counter_ns() - start
+
+    # peak memory, measured from the memory in use before each draw
+    memory_n = min(n, memory_n)
+    peak = np.empty(memory_n, dtype=np.int64)
+    tracemalloc.start()
+    try:
+        for i in range(memory_n):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            try:
+                draw(bracket, rng=rng, as_frame=False)
+            except DrawError:
+                pass
+            peak[i] = tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'draws': n,
+        'draws_per_s': n / (times.sum() / 1e9),
+        'latency_p50_us': float(np.percentile(times, 50)) / 1e3,
+        'latency_p99_us': float(np.percentile(times, 99)) / 1e3,
+        'peak_bytes_mean': float(peak.mean()),
+        'peak_bytes_max': int(peak.max()),
+        'eligibility_calls': count_eligibility(bracket, draw, memory_n, rng),
+        'invalid_rate': invalid / n}
+
+
+# mean number of eligibility checks per draw, counted by a DrawTrace
+def count_eligibility(bracket, draw, n, rng):
+    with tracing(events=False) as trace:
+        for _ in range(n):
+            try:
+                draw(bracket, rng=rng, as_frame=False)
+            except DrawError:
+                pass
+
+    return trace.counters['eligibility'] / n
+
+
+def run_benchmarks(procedures=None, standings=BENCH_STANDINGS, n=10000,
+                   seed=0, memory_n=1000):
+    if procedures is None:
+        procedures = list(DRAW_FUNCTIONS)
+
+    # standings by name, from STANDINGS unless given as a dict
+    if not isinstance(standings, dict):
+        standings = {name: STANDINGS[name] for name in standings}
+
+    rng = np.random.default_rng(seed)
+    results = []
+    for name, group_df in standings.items():
+        bracket = compile_bracket(group_df)
+        for procedure in procedures:
+            result = {'procedure': procedure, 'standings': name,
+                      'clubs': len(bracket.winners) + len(bracket.runners)}
+            result.update(bench_draws(bracket, DRAW_FUNCTIONS[procedure],
+                                      n, rng, memory_n))
+            results.append(result)
+
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version.split()[0],
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'seed': seed},
+        'results': results}
+
+
+# regressions against a saved run
+# a benchmark regresses when its draws per second fall, or its median latency
+# rises, by more than threshold percent, benchmarks missing from either run
+# are skipped
+REGRESSION_CHECKS = (('draws_per_s', -1), ('latency_p50_us', 1))
+
+
+def find_regressions(run, baseline, threshold=10.0):
+    base = {(r['procedure'], r['standings']): r for r in baseline['results']}
+    regressions = []
+    for result in run['results']:
+        key = (result['procedure'], result['standings'])
+        if key not in base:
+            continue
+        for metric, sign in REGRESSION_CHECKS:
+            change = 100 * (result[metric] / base[key][metric] - 1)
+            if sign * change > threshold:
+                regressions.append({'procedure': key[0], 'standings': key[1],
+                                    'metric': metric, 'change_pct': change})
+
+    return regressions
+
+
+def save_benchmarks(run, path):
+    with open(path, 'w') as f:
+        json.dump(run, f, indent=2)
+
+
+def load_benchmarks(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def format_benchmarks(run):
+    lines = ['%-12s %-13s %10s %9s %9s %10s %9s %8s' % (
+        'procedure', 'standings', 'draws/s', 'p50 us', 'p99 us', 'peak B',
+        'elig/draw', 'invalid')]
+    for r in run['results']:
+        lines.append('%-12s %-13s %10.0f %9.1f %9.1f %10.0f %9.1f %8.4f' % (
+            r['procedure'], r['standings'], r['draws_per_s'],
+            r['latency_p50_us'], r['latency_p99_us'], r['peak_bytes_mean'],
+            r['eligibility_calls'], r['invalid_rate']))
+
+    return '\n'.join(lines)
@@ -0,0 +1,495 @@
+# -*- coding: utf-8 -*-
+"""
+Champions League Draw Algorithm - compiled standings and eligibility
+
+@author: Sreejith
+"""
+
+from functools import lru_cache
+
+from . import instrument
+
+
+# eligibility check
+# The round of 16 pairings are determined by means of a draw in accordance with the following principles:
+# - Clubs from the same association cannot be drawn against each other.
+# - Group winners must be drawn against runners-up from a different group.
+# - The runners-up play the first leg at home.
+# other formats are described by which columns the standings have:
+# - without a group or country column that rule does not apply (the
+#   league-phase knockout play-offs have no country protection)
+# - with a pot column, a seeded club (finish 1) can only be drawn against an
+#   unseeded club (finish 2) of the same pot
+
+
+# compiled bracket
+# the standings are turned into integer codes once, so that every eligibility
+# check during a draw is a bitwise AND rather than a DataFrame filter:
+# - winners and runners up are numbered 0..n-1 in the order they appear
+# - groups, countries and pots are numbered in sorted order, a rule that does
+#   not apply gives every club a label of its own (pots: the same label)
+# - runner_ok[j] is a bitmask of the winners runner up j can be drawn against
+# - winner_ok[i] is a bitmask of the runners up winner i can be drawn against
+# - the *_country_ok and *_pot_ok masks only apply the country and pot rules,
+#   they are kept so that eligible_mask can report which rule left a club
+#   without opponents
+# masks are python ints, so brackets of any size compile the same way
+class Bracket:
+
+    def __init__(self, club, group, finish, country, index=None, pot=None):
+        club = list(club)
+        group = club if group is None else list(group)
+        finish = [int(f) for f in finish]
+        country = club if country is None else list(country)
+        pot = [0] * len(club) if pot is None else list(pot)
+        if index is None:
+            index = range(len(club))
+        index = list(index)
+
+        self.groups = sorted(set(group))
+        self.countries = sorted(set(country))
+        self.pots = sorted(set(pot))
+        group_code = {g: i for i, g in enumerate(self.groups)}
+        country_code = {c: i for i, c in enumerate(self.countries)}
+        pot_code = {p: i for i, p in enumerate(self.pots)}
+
+        winner_rows = [i for i, f in enumerate(finish) if f == 1]
+        runner_rows = [i for i, f in enumerate(finish) if f == 2]
+
+        self.winners = [club[i] for i in winner_rows]
+        self.runners = [club[i] for i in runner_rows]
+        self.winner_index = [index[i] for i in winner_rows]
+        self.runner_index = [index[i] for i in runner_rows]
+        self.winner_group = [group_code[group[i]] for i in winner_rows]
+        self.runner_group = [group_code[group[i]] for i in runner_rows]
+        self.winner_country = [country_code[country[i]] for i in winner_rows]
+        self.runner_country = [country_code[country[i]] for i in runner_rows]
+        self.winner_pot = [pot_code[pot[i]] for i in winner_rows]
+        self.runner_pot = [pot_code[pot[i]] for i in runner_rows]
+
+        self.club_code = {}
+        for i, c in enumerate(self.winners):
+            self.club_code[c] = (1, i)
+        for j, c in enumerate(self.runners):
+            self.club_code[c] = (2, j)
+
+        self.all_winners = (1 << len(self.winners)) - 1
+        self.all_runners = (1 << len(self.runners)) - 1
+
+        # eligibility masks, built from the clubs in each group, country and
+        # pot rather than by comparing every pair of clubs
+        winners_in = club_masks(self.winner_group, self.winner_country,
+                                self.winner_pot, len(self.groups),
+                                len(self.countries), len(self.pots))
+        runners_in = club_masks(self.runner_group, self.runner_country,
+                                self.runner_pot, len(self.groups),
+                                len(self.countries), len(self.pots))
+
+        self.runner_country_ok = []
+        self.runner_pot_ok = []
+        self.runner_group_ok = []
+        self.runner_ok = []
+        for j in range(len(self.runners)):
+            country_ok = self.all_winners & ~winners_in[1][self.runner_country[j]]
+            pot_ok = winners_in[2][self.runner_pot[j]]
+            group_ok = self.all_winners & ~winners_in[0][self.runner_group[j]]
+            self.runner_country_ok.append(country_ok)
+            self.runner_pot_ok.append(pot_ok)
+            self.runner_group_ok.append(group_ok)
+            self.runner_ok.append(country_ok & pot_ok & group_ok)
+
+        self.winner_country_ok = []
+        self.winner_pot_ok = []
+        self.winner_group_ok = []
+        self.winner_ok = []
+        for i in range(len(self.winners)):
+            country_ok = self.all_runners & ~runners_in[1][self.winner_country[i]]
+            pot_ok = runners_in[2][self.winner_pot[i]]
+            group_ok = self.all_runners & ~runners_in[0][self.winner_group[i]]
+            self.winner_country_ok.append(country_ok)
+            self.winner_pot_ok.append(pot_ok)
+            self.winner_group_ok.append(group_ok)
+            self.winner_ok.append(country_ok & pot_ok & group_ok)
+
+        # priority countries (have clubs in winner and runners up)
+        priority_countries = set(self.winner_country) & set(self.runner_country)
+        self.priority_winners = 0
+        for i, c in enumerate(self.winner_country):
+            if c in priority_countries:
+                self.priority_winners |= 1 << i
+        self.priority_runners = 0
+        for j, c in enumerate(self.runner_country):
+            if c in priority_countries:
+                self.priority_runners |= 1 << j
+
+        # perfect matching checks, keyed by (winners left, runners left), and
+        # the same checks for every state as a table (see matching_table)
+        self.matching_cache = {}
+        self.matching_states = None
+
+        # number of ways the clubs left can be paired, see matching_count
+        self.count_cache = {}
+
+        # 1C picks of the last four clubs, see endgame and endgame_table
+        self.endgame_cache = {}
+        self.endgame_states = None
+
+
+# masks of the clubs in each group, country and pot
+def club_masks(group, country, pot, groups_n, countries_n, pots_n):
+    masks = ([0] * groups_n, [0] * countries_n, [0] * pots_n)
+    for k, labels in enumerate((group, country, pot)):
+        for i, label in enumerate(labels):
+            masks[k][label] |= 1 << i
+
+    return masks
+
+
+# eligibility masks of each runner up (over the winners) as a (winners,
+# runners up) bool matrix, and a matrix back to masks of each runner up and of
+# each winner
+def mask_matrix(runner_masks, winners_n):
+    import numpy as np
+
+    return np.array([[mask >> i & 1 for mask in runner_masks]
+                     for i in range(winners_n)], dtype=bool).reshape(
+                         winners_n, len(runner_masks))
+
+
+def matrix_masks(ok):
+    import numpy as np
+
+    winners_n, runners_n = ok.shape
+    return ([sum(1 << i for i in np.flatnonzero(ok[:, j]).tolist())
+             for j in range(runners_n)],
+            [sum(1 << j for j in np.flatnonzero(ok[i]).tolist())
+             for i in range(winners_n)])
+
+
+# compiled bracket as flat numpy arrays (winners first, then runners up), and
+# back again, so that a bracket can be shared between processes, the
+# eligibility masks go along so that rule variants (see rules) survive the trip
+BRACKET_MASKS = ('country_ok', 'group_ok', 'pot_ok', 'ok')
+
+
+def bracket_arrays(bracket):
+    import numpy as np
+
+    index = np.array(bracket.winner_index + bracket.runner_index)
+    if index.dtype == object:
+        index = index.astype(str)
+
+    masks = {'mask_' + name: mask_matrix(getattr(bracket, 'runner_' + name),
+                                         len(bracket.winners))
+             for name in BRACKET_MASKS}
+
+    return {**masks,
+        'club': np.array(bracket.winners + bracket.runners),
+        'finish': np.array([1] * len(bracket.winners) + [2] * len(bracket.runners)),
+        'group': np.array(bracket.winner_group + bracket.runner_group),
+        'country': np.array(bracket.winner_country + bracket.runner_country),
+        'pot': np.array(bracket.winner_pot + bracket.runner_pot),
+        'index': index,
+        'groups': np.array(bracket.groups),
+        'countries': np.array(bracket.countries),
+        'pots': np.array(bracket.pots)}
+
+
+def bracket_from_arrays(arrays):
+    bracket = Bracket(arrays['club'].tolist(),
+                      arrays['groups'][arrays['group']].tolist(),
+                      arrays['finish'].tolist(),
+                      arrays['countries'][arrays['country']].tolist(),
+                      index=arrays['index'].tolist(),
+                      pot=arrays['pots'][arrays['pot']].tolist())
+    for name in BRACKET_MASKS:
+        if 'mask_' + name in arrays:
+            runner_masks, winner_masks = matrix_masks(arrays['mask_' + name])
+            setattr(bracket, 'runner_' + name, runner_masks)
+            setattr(bracket, 'winner_' + name, winner_masks)
+
+    return bracket
+
+
+def compile_bracket(group_df):
+    if isinstance(group_df, Bracket):
+        return group_df
+
+    # a DataFrame keeps its index, a dict of columns is numbered from 0, the
+    # group, country and pot columns are optional
+    def column(name):
+        return group_df[name] if name in group_df else None
+
+    return Bracket(group_df['club'], column('group'),
+                   group_df['finish'], column('country'),
+                   index=getattr(group_df, 'index', None), pot=column('pot'))
+
+
+# set bits of a mask, lowest first
+@lru_cache(maxsize=1 << 16)
+def mask_bits(mask):
+    bits = []
+    while mask:
+        low = mask & -mask
+        bits.append(low.bit_length() - 1)
+        mask ^= low
+
+    return tuple(bits)
+
+
+# k-th set bit of a mask (k from 0, lowest first), by halving the bit range
+# and counting the set bits of its lower half, so a pick from n clubs costs
+# log n popcounts instead of listing the clubs
+def select_bit(mask, k):
+    low, width = 0, mask.bit_length()
+    while width > 1:
+        half = width >> 1
+        below = (mask >> low & ((1 << half) - 1)).bit_count()
+        if k < below:
+            width = half
+        else:
+            k -= below
+            low += half
+            width -= half
+
+    return low
+
+
+# eligibility check on a compiled bracket
+# returns the mask of eligible opponents for the club with the given finish
+# and code, among the winners/runners up that are still unchosen
+def eligible_mask(bracket, finish, code, winners_left, runners_left):
+    if instrument.active is not None:
+        instrument.active.counters['eligibility'] += 1
+
+    if finish == 2:
+        ok = winners_left & bracket.runner_ok[code]
+        opposite = winners_left
+        country_ok = bracket.runner_country_ok[code]
+        pot_ok = bracket.runner_pot_ok[code]
+        group_ok = bracket.runner_group_ok[code]
+    else:
+        ok = runners_left & bracket.winner_ok[code]
+        opposite = runners_left
+        country_ok = bracket.winner_country_ok[code]
+        pot_ok = bracket.winner_pot_ok[code]
+        group_ok = bracket.winner_group_ok[code]
+
+    if ok:
+        return ok
+
+    # work out which rule left no eligible clubs
+    if not opposite:
+        raise ValueError(
+            "No elgible clubs - either no more winners or runners up")
+    elif not opposite & country_ok:
+        raise ValueError(
+            "No elgible clubs - all remaining clubs from same country")
+    elif not opposite & pot_ok:
+        raise ValueError(
+            "No elgible clubs - all remaining clubs from other pots")
+    elif not opposite & country_ok & pot_ok & group_ok:
+        raise ValueError(
+            "No elgible clubs - all remaining clubs in same group")
+    else:
+        # only under rule variants that forbid pairs (see rules)
+        raise ValueError(
+            "No elgible clubs - all remaining pairings forbidden")
+
+
+def eligible_clubs(club_name, group_df, winners_left=None, runners_left=None):
+    # winners_left/runners_left restrict a compiled bracket to the unchosen
+    # clubs, by default every club is still unchosen
+    bracket = compile_bracket(group_df)
+    if winners_left is None:
+        winners_left = bracket.all_winners
+    if runners_left is None:
+        runners_left = bracket.all_runners
+
+    finish, code = bracket.club_code[club_name]
+
+    # select opposite of group winner/runner up
+    # select from a different group
+    # select from a different country
+    ok = eligible_mask(bracket, finish, code, winners_left, runners_left)
+    if finish == 2:
+        clubs, index = bracket.winners, bracket.winner_index
+    else:
+        clubs, index = bracket.runners, bracket.runner_index
+
+    import pandas as pd
+
+    ok_bits = mask_bits(ok)
+    ok_clubs = pd.Series([clubs[i] for i in ok_bits],
+                         index=[index[i] for i in ok_bits], name='club')
+
+    return ok_clubs
+
+
+# maximum matching (Hopcroft-Karp)
+# pairs as many runners up left as possible with eligible winners left, the
+# edges being the bits of runner_ok, so each step of a search is one AND over
+# the winners left rather than a pass over every pair of clubs:
+# - a breadth-first search from the unpaired runners up builds layers of
+#   alternating paths until it reaches unpaired winners
+# - a depth-first search along the layers then pairs along as many shortest
+#   augmenting paths as it can, and the two repeat until no path is left
+# an earlier matching can be passed in and is extended in place, so that after
+# a pair or two is taken out only the clubs left unpaired need a search
+class Matching:
+    __slots__ = ('winner', 'runner', 'size')
+
+    def __init__(self, bracket):
+        # winner[j]: winner paired with runner up j, runner[i]: runner up paired
+        # with winner i, -1 when unpaired
+        self.winner = [-1] * len(bracket.runners)
+        self.runner = [-1] * len(bracket.winners)
+        self.size = 0
+
+    def pair(self, winner_code, runner_code):
+        self.winner[runner_code] = winner_code
+        self.runner[winner_code] = runner_code
+
+    # take a winner and a runner up out, unpairing them from their partners
+    def remove(self, winner_code, runner_code):
+        for w, r in ((winner_code, self.runner[winner_code]),
+                     (self.winner[runner_code], runner_code)):
+            if (w >= 0) & (r >= 0) and self.winner[r] == w:
+                self.winner[r] = -1
+                self.runner[w] = -1
+                self.size -= 1
+
+
+def max_matching(bracket, winners_left, runners_left, matching=None):
+    if matching is None:
+        matching = Matching(bracket)
+    runner_ok = bracket.runner_ok
+
+    while True:
+        # layers of runners up, from the unpaired ones
+        free = 0
+        for r in mask_bits(runners_left):
+            if matching.winner[r] < 0:
+                free |= 1 << r
+
+        layers = []
+        frontier = free
+        seen = 0
+        found = False
+        while frontier and not found:
+            layers.append(frontier)
+            reach = 0
+            for r in mask_bits(frontier):
+                reach |= runner_ok[r] & winners_left
+            reach &= ~seen
+            seen |= reach
+
+            frontier = 0
+            for w in mask_bits(reach):
+                if matching.runner[w] < 0:
+                    found = True
+                else:
+                    frontier |= 1 << matching.runner[w]
+
+        if not found:
+            return matching
+
+        # augment along shortest paths, each winner used once per phase
+        last = len(layers) - 1
+        used = 0
+
+        def augment(r, depth):
+            nonlocal used
+            for w in mask_bits(runner_ok[r] & winners_left & ~used):
+                paired = matching.runner[w]
+                if depth == last:
+                    if paired >= 0:
+                        continue
+                elif (paired < 0) or not layers[depth + 1] >> paired & 1:
+                    continue
+
+                used |= 1 << w
+                if (paired < 0) or augment(paired, depth + 1):
+                    matching.pair(w, r)
+                    return True
+
+            # dead end, no need to come back to this runner up in this phase
+            layers[depth] &= ~(1 << r)
+            return False
+
+        for r in mask_bits(free):
+            if augment(r, 0):
+                matching.size += 1
+
+
+# perfect matching check
+# whether every runner up left can still be paired with a winner left, cached
+# per (winners left, runners left) pair
+def can_complete(bracket, winners_left, runners_left):
+    key = (winners_left, runners_left)
+    if key not in bracket.matching_cache:
+        bracket.matching_cache[key] = (
+            max_matching(bracket, winners_left, runners_left).size ==
+            runners_left.bit_count())
+
+    return bracket.matching_cache[key]
+
+
+# number of valid draws
+# the number of ways every runner up left can be paired with a winner left,
+# i.e. the permanent of their 0/1 eligibility matrix, by expanding along the
+# first runner up left: each eligible winner of it leaves a smaller matrix
+# the sub-permanents are cached per (winners left, runners left) mask; the
+# uniform draw and uniform_probabilities pair the runners up in code order,
+# so the runners up left are always the last ones and the cache holds at most
+# one entry per set of winners left, 2 ** winners of them
+# filling the cache takes a quarter of a second and 2 ** 16 entries with 16
+# winners and 16 runners up (later draws 0.25 ms each), 6.5 seconds and 2 **
+# 20 entries with 20, so the counts are limited to brackets of
+# UNIFORM_MAX_RUNNERS of either
+UNIFORM_MAX_RUNNERS = 16
+
+
+def matching_count(bracket, winners_left, runners_left):
+    if not runners_left:
+        return 1
+
+    key = (winners_left, runners_left)
+    if key not in bracket.count_cache:
+        r = (runners_left & -runners_left).bit_length() - 1
+        rest = runners_left & ~(1 << r)
+        bracket.count_cache[key] = sum(
+            matching_count(bracket, winners_left & ~(1 << w), rest)
+            for w in mask_bits(winners_left & bracket.runner_ok[r]))
+
+    return bracket.count_cache[key]
+
+
+# winners that, if eligible, runner up r can be drawn against so that every
+# runner up left can still be paired, given a perfect matching of the clubs
+# left and r:
+# - the winner r is paired with always can
+# - another winner w can when the runner up paired with w can reach r's
+#   partner by an alternating path (an eligible winner, then that winner's
+#   partner and so on), which swaps partners along the path
+# the runners up that can reach r's partner are found by one search backwards
+# from it, so the step costs one AND per winner left
+def complete_winners(bracket, matching, winners_left, runners_left, r):
+    target = matching.winner[r]
+    reached = 1 << target
+    frontier = reached
+    runners_seen = 1 << r
+    while frontier:
+        runners = 0
+        for w in mask_bits(frontier):
+            runners |= bracket.winner_ok[w] & runners_left
+        runners &= ~runners_seen
+        runners_seen |= runners
+
+        frontier = 0
+        for j in mask_bits(runners):
+            frontier |= 1 << matching.winner[j]
+        frontier &= ~reached
+        reached |= frontier
+
+    return reached & winners_left
@@ -0,0 +1,413 @@
+# -*- coding: utf-8 -*-
+"""
+Champions League Draw Algorithm - command line
+
+@author: Sreejith
+"""
+
+import argparse
+import sys
+
+from .draw import PROCEDURES
+from .standings import STANDINGS
+
+
+# one draw, printed as a table of matches
+def run_draw(args):
+    import numpy as np
+
+    from .draw import DRAW_FUNCTIONS, DrawError
+
+    if args.index is None:
+        rng = np.random.default_rng(args.seed)
+    elif args.seed is None:
+        raise SystemExit("--index needs the --seed of the run")
+    else:
+        rng = args.seed
+    try:
+        print(DRAW_FUNCTIONS[args.procedure](
+            STANDINGS[args.standings], rng=rng, draw_index=args.index))
+    except DrawError as e:
+        print(str(e) + " after " + str(e.matches_drawn) + " matches drawn")
+
+
+# distribution of invalid draws and pairings over n simulated draws, with the
+# batch engine or, given --workers, the draw functions over a process pool
+def run_simulate(args):
+    import numpy as np
+
+    from .bracket import compile_bracket
+
+    bracket = compile_bracket(STANDINGS[args.standings])
+    if args.store:
+        from .store import pair_frequency, store_draws
+
+        store = store_draws(args.store, bracket, args.procedure, args.n,
+                            seed=args.seed)
+        draw_p = pair_frequency(store)
+        print(str(draw_p.invalid) + " of " + str(len(store)) + " stored draws "
+              "were invalid using " + args.procedure + " draws and the " +
+              args.standings + " standings")
+        print_pairing(bracket, draw_p.pairing)
+        return
+
+    if args.workers:
+        from .parallel import simulate_draws
+
+        counts = simulate_draws(bracket, args.procedure, args.n,
+                                seed=args.seed, workers=args.workers)
+        pairing, invalid = counts.pairing, counts.invalid
+    else:
+        from .batch import draw_batch, pairing_counts
+
+        draws = draw_batch(bracket, args.n, args.procedure,
+                           rng=np.random.default_rng(args.seed))
+        pairing = pairing_counts(draws, len(bracket.runners))
+        invalid = int(draws.invalid.sum())
+
+    print(str(invalid / args.n) + " of draws were invalid using " +
+          args.procedure + " draws and the " + args.standings + " standings")
+    print_pairing(bracket, pairing / max(args.n - invalid, 1))
+
+
+# exact distribution of invalid draws
+# 2021 group stage standings: 22.4% draw_clubs, 2.4% draw_clubs_country,
+# 4.9% draw_clubs_country_alt, 0.1% draw_clubs_order
+# 2020 group stage standings: 29.6% draw_clubs, 6.5% draw_clubs_country,
+# 5.4% draw_clubs_country_alt, 0.4% draw_clubs_order
+def run_exact(args):
+    from .bracket import compile_bracket
+    from .exact import draw_bias, draw_probabilities
+
+    bracket = compile_bracket(STANDINGS[args.standings])
+    draw_p = draw_probabilities(bracket, args.procedure)
+    print(str(round(draw_p.invalid, 4)) + " of draws are invalid using " +
+          args.procedure + " draws and the " + args.standings + " standings")
+    print_pairing(bracket, draw_p.pairing)
+
+    bias = draw_bias(bracket, args.procedure)
+    print("deviation from a uniform draw: " + str(round(bias.max_abs, 4)) +
+          " largest, " + str(round(bias.total_variation, 4)) +
+          " total variation")
+
+
+# procedures (and rule variants) drawn side by side on the same random numbers,
+# with each invalid rate and the paired difference of each two of them
+def run_compare(args):
+    import json
+
+    import numpy as np
+
+    from .compare import COMPARE_PROCEDURES, compare_procedures
+
+    standings = STANDINGS[args.standings]
+    procedures = list(args.procedure or COMPARE_PROCEDURES)
+    if args.variants:
+        from .rules import compile_rules
+
+        with open(args.variants) as f:
+            variants = json.load(f)
+        for procedure in list(procedures):
+            for k, variant in enumerate(variants):
+                procedures.append(
+                    (procedure + ", " + variant.get('name', 'variant ' + str(k + 1)),
+                     procedure, compile_rules(standings, variant)))
+
+    comparison = compare_procedures(standings, procedures, args.n,
+                                    rng=np.random.default_rng(args.seed))
+    print(str(comparison.draws) + " draws of each on the " + args.standings +
+          " standings")
+    print("%-32s %8s %19s" % ('procedure', 'invalid', 'interval'))
+    for name, draw_p in comparison.probabilities.items():
+        low, high = comparison.intervals[name].invalid
+        print("%-32s %8.4f %9.4f %9.4f" % (name[:32], draw_p.invalid, low, high))
+    print("%-40s %9s %19s %7s %9s %6s" % ('difference', 'invalid', 'interval',
+                                         'TV', 'pairings', 'ratio'))
+    for d in comparison.differences:
+        low, high = d.pairing_interval
+        shifted = int(((low > 0) | (high < 0)).sum())
+        print("%-40s %+9.4f %+9.4f %+9.4f %7.4f %9d %6.1f" % (
+            (d.procedures[0] + " - " + d.procedures[1])[:40], d.invalid,
+            d.interval[0], d.interval[1], d.total_variation, shifted,
+            d.draws_ratio))
+    print("pairings: pairing probabilities that differ at the interval's "
+          "level, ratio: independent draws needed per paired draw")
+
+
+# invalid rate estimated by importance sampling, for rates too small to
+# simulate, with the number of plain draws it stands for
+def run_rare(args):
+    import numpy as np
+
+    from .rare import estimate_invalid
+
+    estimate = estimate_invalid(STANDINGS[args.standings], args.procedure, args.n,
+                                rng=np.random.default_rng(args.seed),
+                                tail=args.tail, rel_error=args.rel_error)
+    low, high = estimate.interval
+    print("%.3g of draws are invalid (%.3g to %.3g) using %s draws and the %s "
+          "standings" % (estimate.invalid, low, high, args.procedure,
+                         args.standings))
+    print("from %d sampled draws, as precise as %.3g plain draws" % (
+        estimate.draws, estimate.naive_draws))
+
+
+# benchmarks of the draw functions, exits with status 1 when a benchmark
+# regresses against the baseline
+def run_bench(args):
+    from .bench import (BENCH_STANDINGS, SCALING_PROCEDURES, find_regressions,
+                        format_benchmarks, load_benchmarks, run_benchmarks,
+                        save_benchmarks, scaling_standings)
+
+    if args.scaling:
+        procedures = args.procedure or SCALING_PROCEDURES
+        standings = scaling_standings(seed=args.seed)
+        n = args.n or 200
+    else:
+        procedures = args.procedure
+        standings = args.standings or BENCH_STANDINGS
+        n = args.n or 10000
+    run = run_benchmarks(procedures, standings, n=n, seed=args.seed)
+    print(format_benchmarks(run))
+    if args.output:
+        save_benchmarks(run, args.output)
+
+    if args.baseline:
+        regressions = find_regressions(run, load_benchmarks(args.baseline),
+                                       args.threshold)
+        for r in regressions:
+            print("regression: " + r['procedure'] + " draws on the " +
+                  r['standings'] + " standings, " + r['metric'] + " " +
+                  "%+.1f%%" % r['change_pct'])
+        if regressions:
+            return 1
+
+
+# exact invalid rate of every season in a directory of standings files
+def run_seasons(args):
+    from .exact import draw_probabilities
+    from .seasons import load_seasons
+
+    loaded = load_seasons(args.directory, strict=args.strict)
+    for season, bracket in loaded.brackets.items():
+        for issue in loaded.issues[season]:
+            print(season + ": " + issue)
+    print("%-24s %6s %8s" % ('season', 'clubs', 'invalid'))
+    for season, bracket in loaded.brackets.items():
+        draw_p = draw_probabilities(bracket, args.procedure)
+        print("%-24s %6d %8.4f" % (season, len(bracket.winners) +
+                                   len(bracket.runners), draw_p.invalid))
+
+
+# exact invalid rate and pairing shift of each rule variant in a JSON file (a
+# list of variants, see rules) against the standard rules
+def run_variants(args):
+    import json
+
+    from .rules import compare_variants
+
+    with open(args.variants) as f:
+        variants = json.load(f)
+    baseline, reports = compare_variants(STANDINGS[args.standings], variants,
+                                         args.procedure)
+    print("%-32s %8s %8s %9s %9s" % ('variant', 'invalid', 'change',
+                                     'max shift', 'TV'))
+    print("%-32s %8.4f" % ('standard rules', baseline.invalid))
+    for r in reports:
+        print("%-32s %8.4f %+8.4f %9.4f %9.4f" % (
+            r.name[:32], r.probabilities.invalid, r.invalid_change,
+            r.max_shift, r.total_variation))
+
+
+# draw probabilities over every way the groups can finish, taking the clubs
+# of the standings as the contenders of their group
+def run_sweep(args):
+    import pandas as pd
+
+    from .scenarios import sweep_scenarios
+
+    sweep = sweep_scenarios(STANDINGS[args.standings], args.procedure,
+                            workers=args.workers)
+    invalid = [s.probabilities.invalid for s in sweep.scenarios]
+    print(str(len(sweep.scenarios)) + " scenarios, " + str(sweep.solved) +
+          " solved, for " + args.procedure + " draws and the " +
+          args.standings + " standings")
+    print(str(round(sweep.invalid, 4)) + " of draws are invalid over all "
+          "scenarios, from " + str(round(min(invalid), 4)) + " to " +
+          str(round(max(invalid), 4)))
+    with pd.option_context('display.width', 250, 'display.max_columns', None):
+        print(pd.DataFrame(sweep.pairing, index=sweep.clubs,
+                           columns=sweep.clubs).round(3))
+
+
+# live draw probabilities over HTTP, see LiveDrawService
+def run_serve(args):
+    import asyncio
+
+    from .live import LiveDraw, serve
+
+    live = LiveDraw(STANDINGS[args.standings], args.procedure)
+    print("serving " + args.procedure + " draw probabilities for the " +
+          args.standings + " standings on http://" + args.host + ":" +
+          str(args.port))
+    try:
+        asyncio.run(serve(live, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+# pairing probabilities, winners down the side and runners up across
+def print_pairing(bracket, pairing):
+    import pandas as pd
+
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(pd.DataFrame(pairing, index=bracket.winners,
+                           columns=bracket.runners).round(3))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m champions_league',
+        description='Champions League round of 16 draw simulations')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    for name, run, help in [
+            ('draw', run_draw, 'draw the round of 16 once'),
+            ('simulate', run_simulate, 'simulate many draws'),
+            ('exact', run_exact, 'exact draw probabilities')]:
+        command = commands.add_parser(name, help=help)
+        command.set_defaults(run=run)
+        command.add_argument('--procedure', choices=PROCEDURES, default='random')
+        command.add_argument('--standings', choices=sorted(STANDINGS),
+                             default='2021')
+        if name != 'exact':
+            command.add_argument('--seed', type=int, default=None)
+        if name == 'draw':
+            command.add_argument('--index', type=int, default=None,
+                                 help='make draw number INDEX of the run with '
+                                      'root seed --seed')
+        if name == 'simulate':
+            command.add_argument('-n', type=int, default=100000,
+                                 help='number of draws')
+            command.add_argument('--workers', type=int, default=None,
+                                 help='run the draw functions over a process '
+                                      'pool with this many workers')
+            command.add_argument('--store',
+                                 help='append the draws to a draw store '
+                                      '(directory) and report on all of it, '
+                                      'each row can be remade from its seed '
+                                      'with DrawStore.replay')
+        if name != 'exact':
+            command.add_argument('--trace',
+                                 help='save a Chrome trace of the draws as JSON')
+
+    command = commands.add_parser(
+        'compare', help='compare procedures on common random numbers')
+    command.set_defaults(run=run_compare)
+    command.add_argument('--procedure', choices=PROCEDURES, action='append',
+                         help='procedure to compare (repeatable, default '
+                              'random, country, country_alt and order)')
+    command.add_argument('--standings', choices=sorted(STANDINGS),
+                         default='2021')
+    command.add_argument('--variants',
+                         help='JSON file with a list of rule variants to draw '
+                              'each procedure under as well')
+    command.add_argument('-n', type=int, default=100000,
+                         help='number of draws of each procedure')
+    command.add_argument('--seed', type=int, default=None)
+
+    command = commands.add_parser(
+        'rare', help='estimate small invalid rates by importance sampling')
+    command.set_defaults(run=run_rare)
+    command.add_argument('--procedure', choices=PROCEDURES, default='order')
+    command.add_argument('--standings', choices=sorted(STANDINGS),
+                         default='2021')
+    command.add_argument('-n', type=int, default=10000,
+                         help='number of sampled draws (per round with '
+                              '--rel-error)')
+    command.add_argument('--tail', type=int, default=4,
+                         help='runners up left from which every way the draw '
+                              'can go on is added up')
+    command.add_argument('--rel-error', type=float, default=None,
+                         help='sample until the interval is within this '
+                              'fraction of the estimate')
+    command.add_argument('--seed', type=int, default=None)
+
+    command = commands.add_parser(
+        'seasons', help='exact invalid rates of a directory of standings files')
+    command.set_defaults(run=run_seasons)
+    command.add_argument('directory', help='directory of .csv/.json standings')
+    command.add_argument('--procedure', choices=PROCEDURES, default='random')
+    command.add_argument('--strict', action='store_true',
+                         help='fail on clubs and countries not in the registry')
+
+    command = commands.add_parser(
+        'variants', help='exact what-if report of rule variants')
+    command.set_defaults(run=run_variants)
+    command.add_argument('variants', help='JSON file with a list of variants')
+    command.add_argument('--procedure', choices=PROCEDURES, default='random')
+    command.add_argument('--standings', choices=sorted(STANDINGS),
+                         default='2021')
+
+    command = commands.add_parser(
+        'sweep', help='exact draw probabilities over every way the groups '
+                      'can finish')
+    command.set_defaults(run=run_sweep)
+    command.add_argument('--procedure', choices=PROCEDURES, default='random')
+    command.add_argument('--standings',
+                         choices=sorted(s for s in STANDINGS
+                                        if 'group' in STANDINGS[s]),
+                         default='2021')
+    command.add_argument('--workers', type=int, default=None,
+                         help='solve the scenarios over a process pool with '
+                              'this many workers (default one per CPU)')
+
+    command = commands.add_parser(
+        'serve', help='serve live draw probabilities over HTTP')
+    command.set_defaults(run=run_serve)
+    command.add_argument('--procedure', choices=PROCEDURES, default='random')
+    command.add_argument('--standings', choices=sorted(STANDINGS),
+                         default='2021')
+    command.add_argument('--host', default='127.0.0.1')
+    command.add_argument('--port', type=int, default=8016)
+
+    command = commands.add_parser(
+        'bench', help='benchmark the draw functions')
+    command.set_defaults(run=run_bench)
+    command.add_argument('--procedure', choices=PROCEDURES, action='append',
+                         help='procedure to benchmark (repeatable, default all, '
+                              'all but uniform with --scaling)')
+    command.add_argument('--standings', choices=sorted(STANDINGS),
+                         action='append',
+                         help='standings to benchmark (repeatable, default all)')
+    command.add_argument('-n', type=int, default=None,
+                         help='number of timed draws per benchmark (default '
+                              '10000, 200 with --scaling)')
+    command.add_argument('--scaling', action='store_true',
+                         help='benchmark synthetic standings of 16 to 256 clubs')
+    command.add_argument('--seed', type=int, default=0)
+    command.add_argument('--output', help='save the results as JSON')
+    command.add_argument('--baseline',
+                         help='JSON results of an earlier run to compare with')
+    command.add_argument('--threshold', type=float, default=10.0,
+                         help='slowdown in percent that counts as a regression')
+
+    args = parser.parse_args(argv)
+    if getattr(args, 'workers', None) and getattr(args, 'store', None):
+        parser.error("--store is written by the batch engine, not worker processes")
+    if not getattr(args, 'trace', None):
+        return args.run(args)
+    if getattr(args, 'workers', None):
+        parser.error("--trace cannot follow draws in worker processes")
+
+    from .instrument import tracing
+
+    with tracing() as trace:
+        status = args.run(args)
+    trace.save_chrome_trace(args.trace)
+
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
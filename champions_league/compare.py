@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Champions League Draw Algorithm - paired procedure comparison
+
+@author: Sreejith
+"""
+
+from collections import namedtuple
+from itertools import combinations
+
+import numpy as np
+
+from .batch import draw_batch
+from .bracket import compile_bracket
+from .draw import PROCEDURES
+from .exact import DrawProbabilities
+from .stream import wilson_interval, winner_pairings
+
+
+# paired comparison
+# comparing procedures with separate simulations, each on its own random
+# numbers, buries the difference between them in the noise of both, so every
+# procedure is drawn on the same random numbers instead (common random
+# numbers):
+# - each chunk draws one (draws, matches, 2, clubs) array of uniform numbers,
+#   a key per club of every match, and every procedure makes its draw i with
+#   the keys of draw i (see draw_batch): each pick takes the candidate with the
+#   smallest key, so two procedures pick the same club whenever it is a
+#   candidate for both, even when their other candidates differ
+# - the differences between procedures are then worked out draw by draw, and
+#   their intervals only hold the noise of where the procedures part ways
+# - pairing differences are over the valid draws of each procedure, their
+#   intervals linearise the two ratios (delta method)
+# - the draws compared are procedure names, or (name, procedure, standings)
+#   triples for a procedure on other standings or rules of the same clubs,
+#   e.g. ('order, no Rus-Ukr', 'order', compile_rules(standings, variant)):
+#   a small change to the rules leaves most draws as they were, which is where
+#   common random numbers help most
+#
+# compare_procedures returns a ProcedureComparison tuple:
+# - draws: number of draws of each procedure
+# - probabilities: DrawProbabilities of each procedure, by name
+# - intervals: (low, high) Wilson intervals of each procedure's
+#   DrawProbabilities, by name
+# - differences: a PairedDifference for each pair of procedures (a, b):
+#   - procedures: names (a, b)
+#   - invalid: invalid rate of a minus that of b
+#   - interval: (low, high) normal interval of the invalid rate difference
+#   - pairing: (winners, runners up) pairing probabilities of a minus b
+#   - pairing_interval: (low, high) normal intervals of the pairing differences
+#   - total_variation: total variation distance between the pairings of a and
+#     b, averaged over the winners as in draw_bias
+#   - draws_ratio: how many times the draws independent simulations would
+#     need for as narrow an invalid rate interval (inf when the paired
+#     difference has no variance)
+ProcedureComparison = namedtuple('ProcedureComparison',
+                                 ['draws', 'probabilities', 'intervals',
+                                  'differences'])
+PairedDifference = namedtuple('PairedDifference',
+                              ['procedures', 'invalid', 'interval', 'pairing',
+                               'pairing_interval', 'total_variation',
+                               'draws_ratio'])
+
+COMPARE_PROCEDURES = ('random', 'country', 'country_alt', 'order')
+
+
+def compare_procedures(last16_df, procedures=COMPARE_PROCEDURES, n=100000,
+                       rng=None, z=1.96, chunk_size=1 << 15):
+    bracket = compile_bracket(last16_df)
+    names, brackets = [], []
+    for arm in procedures:
+        if isinstance(arm, str):
+            name, procedure, arm_bracket = arm, arm, bracket
+        else:
+            name, procedure, standings = arm
+            arm_bracket = compile_bracket(standings)
+        if procedure not in PROCEDURES:
+            raise ValueError("Unknown draw procedure: " + str(procedure))
+        if (arm_bracket.winners != bracket.winners) | \
+                (arm_bracket.runners != bracket.runners):
+            raise ValueError("Draws of " + str(name) + " are of other clubs")
+        names.append(name)
+        brackets.append((procedure, arm_bracket))
+    if len(set(names)) < 2:
+        raise ValueError("Comparisons need at least two procedures")
+    if len(set(names)) < len(names):
+        raise ValueError("Procedures compared twice")
+
+    w, m = len(bracket.winners), len(bracket.runners)
+    if rng is None:
+        rng = np.random.default_rng()
+    pairs = list(combinations(range(len(names)), 2))
+
+    # running sums over the draws, of each procedure and each pair of them
+    valid = np.zeros(len(names), dtype=np.int64)
+    pairing = np.zeros((len(names), w * m), dtype=np.int64)
+    stuck = np.zeros((len(names), m), dtype=np.int64)
+    both_valid = np.zeros(len(pairs), dtype=np.int64)
+    both_pairing = np.zeros((len(pairs), w * m), dtype=np.int64)
+    pairing_valid = np.zeros((len(pairs), 2, w * m), dtype=np.int64)
+
+    for start in range(0, n, chunk_size):
+        size = min(chunk_size, n - start)
+        uniforms = rng.random((size, m, 2, m))
+
+        chunk_valid, chunk_pairing = [], []
+        for p, (procedure, arm_bracket) in enumerate(brackets):
+            draws = draw_batch(arm_bracket, size, procedure, rng, size, uniforms)
+            # pairings of the valid draws (stuck draws keep the matches drawn
+            # before they got stuck)
+            drawn = np.where(draws.invalid[:, None], -1, winner_pairings(draws))
+            rows, winners = np.nonzero(drawn >= 0)
+            pairs_drawn = np.zeros((size, w * m), dtype=bool)
+            pairs_drawn[rows, winners * m + drawn[rows, winners]] = True
+
+            chunk_valid.append(~draws.invalid)
+            chunk_pairing.append(pairs_drawn)
+            valid[p] += int((~draws.invalid).sum())
+            pairing[p] += pairs_drawn.sum(0)
+            stuck[p] += np.bincount(draws.stuck[draws.invalid], minlength=m)
+
+        for k, (a, b) in enumerate(pairs):
+            both_valid[k] += int((chunk_valid[a] & chunk_valid[b]).sum())
+            both_pairing[k] += (chunk_pairing[a] & chunk_pairing[b]).sum(0)
+            pairing_valid[k, 0] += chunk_pairing[a][chunk_valid[b]].sum(0)
+            pairing_valid[k, 1] += chunk_pairing[b][chunk_valid[a]].sum(0)
+
+    # each procedure on its own
+    probabilities, intervals = {}, {}
+    for p, name in enumerate(names):
+        invalid = n - valid[p]
+        probabilities[name] = DrawProbabilities(
+            pairing[p].reshape(w, m) / max(valid[p], 1), invalid / n, stuck[p] / n)
+        intervals[name] = DrawProbabilities(
+            wilson_interval(pairing[p].reshape(w, m), valid[p], z),
+            wilson_interval(invalid, n, z), wilson_interval(stuck[p], n, z))
+
+    # paired differences, draw by draw
+    differences = []
+    for k, (a, b) in enumerate(pairs):
+        prob_a = probabilities[names[a]]
+        prob_b = probabilities[names[b]]
+
+        # invalid_a - invalid_b is the mean of valid_b - valid_a
+        invalid = prob_a.invalid - prob_b.invalid
+        sum_sq = valid[a] + valid[b] - 2 * both_valid[k]
+        variance = max(sum_sq / n - invalid ** 2, 0) * n / max(n - 1, 1)
+        std_error = np.sqrt(variance / n)
+        independent = (prob_a.invalid * (1 - prob_a.invalid) +
+                       prob_b.invalid * (1 - prob_b.invalid))
+        draws_ratio = independent / variance if variance > 0 else float('inf')
+
+        # pairing_a / valid_a - pairing_b / valid_b, linearised
+        p_a, p_b = prob_a.pairing.ravel(), prob_b.pairing.ravel()
+        v_a, v_b = max(valid[a], 1) / n, max(valid[b], 1) / n
+        cross = (both_pairing[k] - p_b * pairing_valid[k, 0] -
+                 p_a * pairing_valid[k, 1] + p_a * p_b * both_valid[k])
+        sum_sq_pairing = (p_a * (1 - p_a) * valid[a] / v_a ** 2 +
+                          p_b * (1 - p_b) * valid[b] / v_b ** 2 -
+                          2 * cross / (v_a * v_b))
+        std_error_pairing = (np.sqrt(np.maximum(sum_sq_pairing, 0)) / n).reshape(w, m)
+
+        shift = prob_a.pairing - prob_b.pairing
+        differences.append(PairedDifference(
+            (names[a], names[b]), invalid,
+            (invalid - z * std_error, invalid + z * std_error), shift,
+            (shift - z * std_error_pairing, shift + z * std_error_pairing),
+            float(np.abs(shift).sum(1).mean() / 2), draws_ratio))
+
+    return ProcedureComparison(n, probabilities, intervals, differences)
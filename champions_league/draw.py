@@ -0,0 +1,567 @@
+# -*- coding: utf-8 -*-
+"""
+Champions League Draw Algorithm - draw procedures
+
+@author: Sreejith
+"""
+
+from array import array
+from functools import lru_cache, wraps
+
+from . import instrument
+from .bracket import (UNIFORM_MAX_RUNNERS, compile_bracket, complete_winners,
+                      eligible_mask, mask_bits, matching_count, max_matching,
+                      select_bit)
+from .endgame import last4_mask
+
+
+# the global np.random state, numpy is only loaded once a draw needs it
+def global_rng():
+    import numpy as np
+
+    return np.random
+
+
+# counter-based random numbers, one stream per draw
+# draw number `index` of a run with root seed `seed` is made with its own Philox
+# generator, keyed by the seed, with the index in the top word of its counter,
+# so any draw of a run can be made again on its own, on any worker, however
+# many random numbers the draws before it took
+@lru_cache(maxsize=64)
+def philox_key(seed):
+    import numpy as np
+
+    return tuple(np.random.SeedSequence(seed).generate_state(2, np.uint64).tolist())
+
+
+def draw_rng(seed, index):
+    import numpy as np
+
+    return np.random.Generator(
+        np.random.Philox(key=philox_key(seed), counter=[0, 0, 0, index]))
+
+
+# draw functions take a draw_index: rng is then the root seed of a run and the
+# draw is made with draw_rng(rng, draw_index)
+def replayable(draw):
+    @wraps(draw)
+    def indexed_draw(last16_df, rng=None, as_frame=True, draw_index=None):
+        if draw_index is not None:
+            if rng is None:
+                raise ValueError("A draw index needs the root seed of the run as rng")
+            rng = draw_rng(rng, draw_index)
+
+        return draw(last16_df, rng, as_frame)
+
+    return indexed_draw
+
+
+# pick one set bit of a mask at random, rng is a numpy Generator or by default
+# the global np.random state (the same random numbers as rng.choice over the
+# set bits)
+def choice_bit(mask, rng=None):
+    if rng is None:
+        rng = global_rng()
+    if hasattr(rng, 'integers'):
+        k = rng.integers(mask.bit_count())
+    else:
+        k = rng.randint(mask.bit_count())
+
+    return select_bit(mask, int(k))
+
+
+# pick one of the given codes with probability proportional to its weight
+def choice_weighted(codes, weights, rng=None):
+    if rng is None:
+        rng = global_rng()
+
+    u = rng.random() * sum(weights)
+    for code, weight in zip(codes, weights):
+        if weight:
+            chosen = code
+            u -= weight
+            if u < 0:
+                break
+
+    return chosen
+
+
+# raised when a draw gets stuck, keeps how many matches were drawn before
+class DrawError(ValueError):
+
+    def __init__(self, message, matches_drawn):
+        super().__init__(message)
+        self.matches_drawn = matches_drawn
+
+
+# draw state
+# what a draw procedure keeps track of while it runs, in a few small integers
+# instead of DataFrames:
+# - winners_left, runners_left: masks of the clubs still unchosen
+# - match_i: number of the next match
+# - winner, runner: preallocated codes of the clubs drawn in each match
+#   (short int arrays, so that no numpy is needed to hold them)
+# the matches DataFrame is only built when asked for
+class DrawState:
+    __slots__ = ('bracket', 'winners_left', 'runners_left', 'match_i',
+                 'winner', 'runner')
+
+    def __init__(self, bracket):
+        self.bracket = bracket
+        self.winners_left = bracket.all_winners
+        self.runners_left = bracket.all_runners
+        self.match_i = 1
+        self.winner = array('h', [-1]) * len(bracket.runners)
+        self.runner = array('h', [-1]) * len(bracket.runners)
+
+    def record(self, winner_code, runner_code):
+        self.winner[self.match_i - 1] = winner_code
+        self.runner[self.match_i - 1] = runner_code
+        self.match_i += 1
+
+    def shuffle(self, rng):
+        n = self.match_i - 1
+        order = rng.permutation(n).tolist()
+        self.winner[:n] = array('h', [self.winner[i] for i in order])
+        self.runner[:n] = array('h', [self.runner[i] for i in order])
+
+    def matches_frame(self):
+        import pandas as pd
+
+        n = self.match_i - 1
+        return pd.DataFrame({
+            'match': range(1, n + 1),
+            'winner': [self.bracket.winners[w] for w in self.winner[:n]],
+            'runner': [self.bracket.runners[r] for r in self.runner[:n]]},
+            index=range(1, n + 1))
+
+
+# draw functions report to the active DrawTrace, if any (see instrument)
+def traced(procedure):
+    def decorate(draw):
+        @wraps(draw)
+        def traced_draw(*args, **kwargs):
+            trace = instrument.active
+            if trace is None:
+                return draw(*args, **kwargs)
+
+            return trace.run_draw(procedure, draw, args, kwargs)
+
+        return traced_draw
+
+    return decorate
+
+
+# draw
+# proceedure for draw:
+# 1 - pick runner up at random
+# 2 - select from eligible winners
+
+
+@traced('random')
+@replayable
+def draw_clubs(last16_df, rng=None, as_frame=True):
+    # initialise
+    bracket = compile_bracket(last16_df)
+    if rng is None:
+        rng = global_rng()
+    state = DrawState(bracket)
+    trace = instrument.active
+
+    while state.runners_left:
+        # 1 - pick runner up at random
+        if trace is not None:
+            trace.branch(state.match_i, '1')
+        runner_code = choice_bit(state.runners_left, rng)
+        state.runners_left &= ~(1 << runner_code)
+
+        # 2 - select from eligible winner
+        try:
+            ok_winners = eligible_mask(
+                bracket, 2, runner_code, state.winners_left, state.runners_left)
+        except ValueError as e:
+            raise DrawError(str(e), state.match_i - 1)
+        else:
+            winner_code = choice_bit(ok_winners, rng)
+            state.winners_left &= ~(1 << winner_code)
+
+        # record drawn teams
+        state.record(winner_code, runner_code)
+
+    return state.matches_frame() if as_frame else state
+
+
+# enhanced draw mechanism to avoid no elgible clubs
+# draw clubs that are likely to have no elgible clubs, these are:
+# - from a country that have clubs in winner and runners up
+
+# proceedure for draw:
+# 1A - pick runner up at random from a country with clubs in winner and runner
+# 1B - pick runner up at random
+# 2 - select from eligible winners
+
+# 1C - if the final two matches to draw have two clubs from the same group, there will be auto assign
+
+
+@traced('country')
+@replayable
+def draw_clubs_country(last16_df, rng=None, as_frame=True):
+    # initialise
+    bracket = compile_bracket(last16_df)
+    if rng is None:
+        rng = global_rng()
+    state = DrawState(bracket)
+    trace = instrument.active
+
+    # select runners up from priority countries (have clubs in winner and runners up)
+    priority_clubs_runners = bracket.priority_runners
+
+    while state.runners_left:
+        runners_last = last4_mask(bracket, 2, state.winners_left, state.runners_left)
+        if runners_last:
+            # 1C - assign matches if 2 teams remaining from the same group
+            # 2nd last match
+            # select club with group repeat or country repeat
+            # if both group and country repeat and is winner and runners, then no solution using 4 clubs
+            if trace is not None:
+                trace.branch(state.match_i, '1C')
+            runner_code = choice_bit(runners_last, rng)
+
+        elif priority_clubs_runners & state.runners_left:
+            # 1A - pick runner up at random from a country with clubs in winner and runner
+            if trace is not None:
+                trace.branch(state.match_i, '1A')
+            runner_code = choice_bit(priority_clubs_runners & state.runners_left, rng)
+
+        else:
+            # 1B - pick runner up at random
+            if trace is not None:
+                trace.branch(state.match_i, '1B')
+            runner_code = choice_bit(state.runners_left, rng)
+
+        state.runners_left &= ~(1 << runner_code)
+
+        # 2 - select from eligible winner
+        try:
+            ok_winners = eligible_mask(
+                bracket, 2, runner_code, state.winners_left, state.runners_left)
+        except ValueError as e:
+            raise DrawError(str(e), state.match_i - 1)
+        else:
+            winner_code = choice_bit(ok_winners, rng)
+            state.winners_left &= ~(1 << winner_code)
+
+        # record drawn teams
+        state.record(winner_code, runner_code)
+
+    return state.matches_frame() if as_frame else state
+
+
+# alternate draw between winners and runners up (as performed in 2020 draw)
+# but will first prioritise countries with winners and runners up
+@traced('country_alt')
+@replayable
+def draw_clubs_country_alt(last16_df, rng=None, as_frame=True):
+    # initialise
+    bracket = compile_bracket(last16_df)
+    if rng is None:
+        rng = global_rng()
+    state = DrawState(bracket)
+    trace = instrument.active
+
+    # select clubs from priority countries (have clubs in winner and runners up)
+    priority_clubs_winners = bracket.priority_winners
+    priority_clubs_runners = bracket.priority_runners
+
+    while state.winners_left | state.runners_left:
+        # odd matches start with a runner up, even matches with a winner
+        finish = 2 if state.match_i % 2 == 1 else 1
+        if finish == 2:
+            clubs_left = state.runners_left
+            priority_left = priority_clubs_runners & state.runners_left
+        else:
+            clubs_left = state.winners_left
+            priority_left = priority_clubs_winners & state.winners_left
+
+        clubs_last = last4_mask(bracket, finish, state.winners_left, state.runners_left)
+        if clubs_last:
+            # 1C - assign matches if 2 teams remaining from the same group
+            # 2nd last match
+            # select club with group repeat or country repeat
+            # if both group and country repeat and is winner and runners, then no solution using 4 clubs
+            if trace is not None:
+                trace.branch(state.match_i, '1C')
+            club_code = choice_bit(clubs_last, rng)
+
+        elif priority_left:
+            # 1A - pick winner/runner up at random from a country with clubs in winner and runner
+            if trace is not None:
+                trace.branch(state.match_i, '1A')
+            club_code = choice_bit(priority_left, rng)
+
+        else:
+            # 1B - pick winner/runner up at random
+            if trace is not None:
+                trace.branch(state.match_i, '1B')
+            club_code = choice_bit(clubs_left, rng)
+
+        if finish == 2:
+            runner_code = club_code
+            state.runners_left &= ~(1 << runner_code)
+        else:
+            winner_code = club_code
+            state.winners_left &= ~(1 << winner_code)
+
+        # 2 - select from eligible winner/runner up
+        try:
+            ok_clubs = eligible_mask(
+                bracket, finish, club_code, state.winners_left, state.runners_left)
+        except ValueError as e:
+            raise DrawError(str(e), state.match_i - 1)
+        else:
+            if finish == 2:
+                winner_code = choice_bit(ok_clubs, rng)
+                state.winners_left &= ~(1 << winner_code)
+            else:
+                runner_code = choice_bit(ok_clubs, rng)
+                state.runners_left &= ~(1 << runner_code)
+
+        # record drawn teams
+        state.record(winner_code, runner_code)
+
+    return state.matches_frame() if as_frame else state
+
+
+# enhanced draw mechanism to avoid no elgible clubs
+# draw clubs in batches based on number of eligible clubs remaining
+
+# proceedure for draw:
+# 0 - order runner up by number of eligible teams
+# 1 - pick runner up at random (if same number of eligble teams)
+# 2 - select from eligible winners
+# 3 - randomise match numbers
+
+# 1C - if the final two matches to draw have two clubs from the same group, there will be auto assign
+
+# the number of eligible teams is counted once, then kept up to date with a few
+# mask operations per match: the runners up left are kept in buckets (masks) by
+# their number of eligible teams, the runners up to pick from are the lowest
+# bucket that is not empty, and drawing a winner moves the runners up that were
+# eligible for it (its column, bracket.winner_ok) down one bucket
+
+@traced('order')
+@replayable
+def draw_clubs_order(last16_df, rng=None, as_frame=True):
+    # initialise
+    bracket = compile_bracket(last16_df)
+    if rng is None:
+        rng = global_rng()
+    state = DrawState(bracket)
+    trace = instrument.active
+
+    # 0 - order runner up by "difficulty" (number of eligible teams)
+    if trace is not None:
+        score_start = trace.clock()
+    buckets = [0] * (len(bracket.winners) + 1)
+    try:
+        for r in mask_bits(state.runners_left):
+            eli_clubs = eligible_mask(
+                bracket, 2, r, state.winners_left, state.runners_left).bit_count()
+            buckets[eli_clubs] |= 1 << r
+    except ValueError as e:
+        raise DrawError(str(e), 0)
+    eli_club_i = 0
+    while eli_club_i < len(buckets) - 1 and not buckets[eli_club_i]:
+        eli_club_i += 1
+    eli_club_max = len(buckets) - 1
+    while eli_club_max > eli_club_i and not buckets[eli_club_max]:
+        eli_club_max -= 1
+    if trace is not None:
+        trace.phase('score', score_start)
+
+    while state.runners_left:
+        runners_last = last4_mask(bracket, 2, state.winners_left, state.runners_left)
+        if runners_last:
+            # 1C - assign matches if 2 teams remaining from the same group
+            # 2nd last match
+            # select club with group repeat or country repeat
+            # if both group and country repeat and is winner and runners, then no solution using 4 clubs
+            if trace is not None:
+                trace.branch(state.match_i, '1C')
+            runner_code = choice_bit(runners_last, rng)
+
+        else:
+            # 1 - pick runner up at random (if same number of eligble teams)
+            if trace is not None:
+                trace.branch(state.match_i, '1')
+            runner_code = choice_bit(buckets[eli_club_i], rng)
+
+        state.runners_left &= ~(1 << runner_code)
+        for c in range(eli_club_i, eli_club_max + 1):
+            buckets[c] &= ~(1 << runner_code)
+
+        # 2 - select from eligible winner
+        try:
+            ok_winners = eligible_mask(
+                bracket, 2, runner_code, state.winners_left, state.runners_left)
+            winner_code = choice_bit(ok_winners, rng)
+            state.winners_left &= ~(1 << winner_code)
+
+            if trace is not None:
+                rescore_start = trace.clock()
+            column = bracket.winner_ok[winner_code]
+            for c in range(eli_club_i, eli_club_max + 1):
+                moved = buckets[c] & column
+                buckets[c] ^= moved
+                buckets[c - 1] |= moved
+            if buckets[eli_club_i - 1]:
+                eli_club_i -= 1
+            if eli_club_i == 0:
+                # raises with the reason no winners are left
+                r = mask_bits(buckets[0])[0]
+                eligible_mask(bracket, 2, r, state.winners_left, state.runners_left)
+            while eli_club_i < eli_club_max and not buckets[eli_club_i]:
+                eli_club_i += 1
+            if trace is not None:
+                trace.phase('rescore', rescore_start, {'step': state.match_i})
+        except ValueError as e:
+            raise DrawError(str(e), state.match_i - 1)
+
+        # record drawn teams
+        state.record(winner_code, runner_code)
+
+    # 3 - randomise match number
+    state.shuffle(rng)
+
+    return state.matches_frame().reset_index(drop=True) if as_frame else state
+
+
+# look-ahead draw (as performed by UEFA's computer)
+# a winner is only drawn against a runner up if the clubs left can still all be
+# paired afterwards, so the draw never gets stuck
+# a perfect matching of the clubs left is kept alongside the draw, so finding
+# the winners that leave a complete draw is one search (see complete_winners)
+# and taking a pair out repairs the matching along one augmenting path
+
+# proceedure for draw:
+# 1 - pick runner up at random
+# 2 - select from eligible winners that leave a complete draw
+
+
+@traced('lookahead')
+@replayable
+def draw_clubs_lookahead(last16_df, rng=None, as_frame=True):
+    # initialise
+    bracket = compile_bracket(last16_df)
+    if rng is None:
+        rng = global_rng()
+    matching = max_matching(bracket, bracket.all_winners, bracket.all_runners)
+    if matching.size < len(bracket.runners):
+        raise DrawError("No valid draw - the clubs cannot all be paired", 0)
+
+    state = DrawState(bracket)
+    trace = instrument.active
+
+    while state.runners_left:
+        # 1 - pick runner up at random
+        if trace is not None:
+            trace.branch(state.match_i, '1')
+        runner_code = choice_bit(state.runners_left, rng)
+        state.runners_left &= ~(1 << runner_code)
+
+        # 2 - select from eligible winners that leave a complete draw
+        if trace is not None:
+            lookahead_start = trace.clock()
+        ok_winners = eligible_mask(
+            bracket, 2, runner_code, state.winners_left, state.runners_left)
+        ok_winners &= complete_winners(
+            bracket, matching, state.winners_left, state.runners_left, runner_code)
+        if trace is not None:
+            trace.phase('lookahead', lookahead_start, {'step': state.match_i})
+
+        winner_code = choice_bit(ok_winners, rng)
+        state.winners_left &= ~(1 << winner_code)
+        matching.remove(winner_code, runner_code)
+        max_matching(bracket, state.winners_left, state.runners_left, matching)
+
+        # record drawn teams
+        state.record(winner_code, runner_code)
+
+    return state.matches_frame() if as_frame else state
+
+
+# uniform draw
+# every valid draw is equally likely: the runners up are paired in code order,
+# each with an eligible winner drawn with probability proportional to the
+# number of ways the clubs left afterwards can be paired (see matching_count),
+# which never leaves the draw stuck and makes no pairing likelier than another
+# the pairs are then drawn out in a random order of runners up, which is
+# independent of the pairing, so the draw is the same as picking the runner up
+# at random and weighting its winners, but only ever counts the states of the
+# last runners up (one per set of winners left); brackets of up to
+# UNIFORM_MAX_RUNNERS winners and runners up are counted
+
+# proceedure for draw:
+# 0 - pair every runner up, in code order, with an eligible winner weighted by
+#     the number of valid draws left
+# 1 - pick runner up at random
+# 2 - draw the winner it was paired with
+
+
+@traced('uniform')
+@replayable
+def draw_clubs_uniform(last16_df, rng=None, as_frame=True):
+    # initialise
+    bracket = compile_bracket(last16_df)
+    if max(len(bracket.winners), len(bracket.runners)) > UNIFORM_MAX_RUNNERS:
+        raise ValueError("Uniform draws need at most " + str(UNIFORM_MAX_RUNNERS) +
+                         " winners and runners up")
+    if rng is None:
+        rng = global_rng()
+    if not matching_count(bracket, bracket.all_winners, bracket.all_runners):
+        raise DrawError("No valid draw - the clubs cannot all be paired", 0)
+
+    state = DrawState(bracket)
+    trace = instrument.active
+
+    # 0 - pair the runners up in code order, weighted by the valid draws left
+    partner = []
+    winners_left, runners_left = bracket.all_winners, bracket.all_runners
+    for r in range(len(bracket.runners)):
+        runners_left &= ~(1 << r)
+        ok_winners = mask_bits(eligible_mask(bracket, 2, r, winners_left,
+                                             runners_left))
+        partner.append(choice_weighted(
+            ok_winners,
+            [matching_count(bracket, winners_left & ~(1 << w), runners_left)
+             for w in ok_winners],
+            rng))
+        winners_left &= ~(1 << partner[r])
+
+    while state.runners_left:
+        # 1 - pick runner up at random
+        if trace is not None:
+            trace.branch(state.match_i, '1')
+        runner_code = choice_bit(state.runners_left, rng)
+        state.runners_left &= ~(1 << runner_code)
+
+        # 2 - draw the winner it was paired with
+        winner_code = partner[runner_code]
+        state.winners_left &= ~(1 << winner_code)
+
+        # record drawn teams
+        state.record(winner_code, runner_code)
+
+    return state.matches_frame() if as_frame else state
+
+
+# draw functions by procedure name
+DRAW_FUNCTIONS = {
+    'random': draw_clubs,
+    'country': draw_clubs_country,
+    'country_alt': draw_clubs_country_alt,
+    'order': draw_clubs_order,
+    'lookahead': draw_clubs_lookahead,
+    'uniform': draw_clubs_uniform}
+
+PROCEDURES = tuple(DRAW_FUNCTIONS)
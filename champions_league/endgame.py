@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Champions League Draw Algorithm - 1C rule for the last four clubs
+
+@author: Sreejith
+"""
+
+from collections import namedtuple
+from functools import lru_cache
+
+from .bracket import mask_bits
+
+
+# 1C - endgame table
+# when four clubs remain and two of them share a group or a country, the club
+# to draw first is taken from the clubs of the given finish that repeat a
+# group or country (or any club of that finish if none repeat)
+# only the groups and countries of the last four clubs matter, so each
+# configuration is solved once:
+# - the signature numbers groups and countries in order of first appearance
+#   over (winner, winner, runner up, runner up), so relabelled configurations
+#   share it
+# - solve_endgame gives whether the rule applies and the first picks it allows
+#   (masks over the two winners and the two runners up)
+# - endgame turns the solution into club masks, cached per bracket state
+Endgame = namedtuple('Endgame', ['applies', 'winners', 'runners'])
+
+
+def canonical_labels(labels):
+    seen = {}
+    return tuple(seen.setdefault(label, len(seen)) for label in labels)
+
+
+@lru_cache(maxsize=None)
+def solve_endgame(signature):
+    groups, countries = signature
+    applies = (len(set(groups)) < 4) | (len(set(countries)) < 4)
+
+    repeat = [(groups.count(groups[k]) == 2) | (countries.count(countries[k]) == 2)
+              for k in range(4)]
+    winners = (repeat[0] | repeat[1] << 1) or 3
+    runners = (repeat[2] | repeat[3] << 1) or 3
+
+    if not applies:
+        winners = runners = 0
+
+    return Endgame(applies, winners, runners)
+
+
+def endgame(bracket, winners_left, runners_left):
+    key = (winners_left, runners_left)
+    if key not in bracket.endgame_cache:
+        winners = mask_bits(winners_left)
+        runners = mask_bits(runners_left)
+        signature = (
+            canonical_labels([bracket.winner_group[i] for i in winners] +
+                             [bracket.runner_group[j] for j in runners]),
+            canonical_labels([bracket.winner_country[i] for i in winners] +
+                             [bracket.runner_country[j] for j in runners]))
+        solved = solve_endgame(signature)
+
+        winners_pick = 0
+        for k, i in enumerate(winners):
+            winners_pick |= (solved.winners >> k & 1) << i
+        runners_pick = 0
+        for k, j in enumerate(runners):
+            runners_pick |= (solved.runners >> k & 1) << j
+
+        bracket.endgame_cache[key] = Endgame(solved.applies, winners_pick,
+                                             runners_pick)
+
+    return bracket.endgame_cache[key]
+
+
+# clubs of the given finish to draw first under the 1C rule, 0 when the rule
+# does not apply
+def last4_mask(bracket, finish, winners_left, runners_left):
+    if (winners_left.bit_count() != 2) | (runners_left.bit_count() != 2):
+        return 0
+
+    last4 = endgame(bracket, winners_left, runners_left)
+
+    return last4.winners if finish == 1 else last4.runners
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+Champions League Draw Algorithm - exact draw probabilities
+
+@author: Sreejith
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from .batch import (DENSE_MAX_RUNNERS, bit_tables, first_candidates,
+                    lookahead_ok, matching_counts, matching_table,
+                    uniform_weights)
+from .bracket import (UNIFORM_MAX_RUNNERS, compile_bracket, mask_bits,
+                      matching_count)
+from .draw import PROCEDURES
+
+
+# exact draw probabilities
+# with 8 winners and 8 runners up a draw can only pass through the states
+# (winners left, runners left) with as many winners as runners up left, at most
+# 12870 of them, so every procedure can be solved exactly instead of sampled:
+# - a state is numbered winners_left << m | runners_left
+# - step_probabilities gives the probability of each pairing in the next match
+#   from a batch of states, picking the first club with first_candidates like
+#   draw_batch (the alternating draw's parity follows from the clubs left)
+# - a forward pass gives the probability of reaching each state
+# - a backward pass gives the probability of completing the draw from it
+#
+# draw_probabilities returns a DrawProbabilities tuple:
+# - pairing: (winners, runners up) probability of each pairing in a valid draw
+# - invalid: probability that the draw gets stuck
+# - stuck: probability of getting stuck with 0, 1, ... matches drawn
+DrawProbabilities = namedtuple('DrawProbabilities',
+                               ['pairing', 'invalid', 'stuck'])
+
+
+# states where a runner up left has no eligible winners left
+def dead_states(bracket, winners_left, runners_left):
+    m = len(bracket.runners)
+    popcount = bit_tables(m)[0]
+    club_bits = 1 << np.arange(m)
+    runner_ok = np.array(bracket.runner_ok, dtype=np.int64)
+
+    eli_clubs = popcount[winners_left[..., None] & runner_ok]
+    left = (runners_left[..., None] & club_bits) != 0
+
+    return (left & (eli_clubs == 0)).any(-1)
+
+
+# probability of each (winner, runner up) pairing in the next match from a
+# batch of states with k matches drawn, and of the draw getting stuck instead
+def step_probabilities(bracket, procedure, k, winners_left, runners_left):
+    m = len(bracket.runners)
+    popcount = bit_tables(m)[0]
+    club_bits = 1 << np.arange(m)
+
+    # 1 - pick the first club of the match
+    finish, candidates = first_candidates(
+        bracket, procedure, k, winners_left, runners_left)
+    p_first = (((candidates[:, None] & club_bits) != 0) /
+               popcount[candidates][:, None])
+
+    # 2 - select from eligible opponents
+    if finish == 2:
+        ok = winners_left[:, None] & np.array(bracket.runner_ok, dtype=np.int64)
+    else:
+        ok = runners_left[:, None] & np.array(bracket.winner_ok, dtype=np.int64)
+    if procedure in ('lookahead', 'uniform'):
+        ok = lookahead_ok(matching_table(bracket), m, winners_left[:, None],
+                          runners_left[:, None] & ~club_bits, ok)
+    eli_clubs = popcount[ok]
+    if procedure == 'uniform':
+        weights = uniform_weights(matching_counts(bracket), m, winners_left[:, None],
+                                  runners_left[:, None] & ~club_bits, ok)
+        p_second = weights / np.maximum(weights.sum(2), 1)[:, :, None]
+    else:
+        p_second = (((ok[:, :, None] & club_bits) != 0) /
+                    np.maximum(eli_clubs, 1)[:, :, None])
+
+    prob = p_first[:, :, None] * p_second
+    stuck = (p_first * (eli_clubs == 0)).sum(1)
+    if finish == 2:
+        prob = prob.transpose(0, 2, 1)
+
+    if procedure == 'order':
+        # 0 - the draw stops as soon as a runner up has no eligible teams
+        dead = dead_states(bracket, winners_left, runners_left)
+        prob[dead] = 0
+        stuck[dead] = 1
+
+        # re-score the remaining runners up after the match
+        moves = np.nonzero(prob)
+        dead = dead_states(bracket,
+                           winners_left[moves[0]] & ~club_bits[moves[1]],
+                           runners_left[moves[0]] & ~club_bits[moves[2]])
+        np.add.at(stuck, moves[0][dead], prob[moves][dead])
+        prob[tuple(move[dead] for move in moves)] = 0
+
+    return prob, stuck
+
+
+def draw_probabilities(last16_df, procedure='random'):
+    if procedure not in PROCEDURES:
+        raise ValueError("Unknown draw procedure: " + str(procedure))
+
+    bracket = compile_bracket(last16_df)
+    m = len(bracket.runners)
+    if len(bracket.winners) != m:
+        raise ValueError("Exact draw probabilities need as many winners as runners up")
+    if m > DENSE_MAX_RUNNERS:
+        raise ValueError("Exact draw probabilities need at most " +
+                         str(DENSE_MAX_RUNNERS) + " runners up")
+
+    # state number dropped by each (winner, runner up) pairing
+    club_bits = 1 << np.arange(m)
+    pair_bits = (club_bits[:, None] << m) | club_bits[None, :]
+
+    # forward pass - probability of reaching each state
+    start = bracket.all_winners << m | bracket.all_runners
+    reach = np.zeros(1 << 2 * m)
+    reach[start] = 1.0
+    states = np.array([start])
+    stuck = np.zeros(m)
+    layers = []
+    for k in range(m):
+        prob, stuck_k = step_probabilities(
+            bracket, procedure, k, states >> m, states & bracket.all_runners)
+        stuck[k] = reach[states] @ stuck_k
+
+        moves = prob > 0
+        states_next = np.where(moves, states[:, None, None] - pair_bits, 0)
+        flow = reach[states][:, None, None] * prob
+        reach += np.bincount(states_next[moves], weights=flow[moves],
+                             minlength=reach.size)
+
+        layers.append((states, prob, states_next))
+        states = np.unique(states_next[moves])
+
+    # backward pass - probability of completing the draw from each state
+    complete = np.zeros(1 << 2 * m)
+    complete[0] = 1.0
+    for states, prob, states_next in reversed(layers):
+        complete[states] = (prob * complete[states_next]).sum((1, 2))
+
+    # pairings drawn on the way to a valid draw
+    pairing = np.zeros((m, m))
+    if complete[start] > 0:
+        for states, prob, states_next in layers:
+            pairing += (reach[states][:, None, None] * prob *
+                        complete[states_next]).sum(0)
+        pairing /= complete[start]
+
+    return DrawProbabilities(pairing, stuck.sum(), stuck)
+
+
+# exact uniform draw
+# when every valid draw is equally likely, a winner meets a runner up in as
+# many valid draws as pair them, so the pairing matrix follows from counts
+# (permanents) instead of the state by state solution above, and works for
+# brackets of any shape (of up to UNIFORM_MAX_RUNNERS winners and runners up):
+# the runners up are paired in code order as in draw_clubs_uniform, ways
+# holding the number of ways to pair the runners up so far that leave each
+# set of winners, and the pairs of runner up r are counted by the ways to
+# reach the winners before it times the ways to complete the draw after it
+def uniform_probabilities(last16_df):
+    bracket = compile_bracket(last16_df)
+    if max(len(bracket.winners), len(bracket.runners)) > UNIFORM_MAX_RUNNERS:
+        raise ValueError("Uniform draw probabilities need at most " +
+                         str(UNIFORM_MAX_RUNNERS) + " winners and runners up")
+    total = matching_count(bracket, bracket.all_winners, bracket.all_runners)
+
+    pairing = np.zeros((len(bracket.winners), len(bracket.runners)))
+    stuck = np.zeros(len(bracket.runners))
+    if not total:
+        stuck[0] = 1.0
+        return DrawProbabilities(pairing, 1.0, stuck)
+
+    ways = {bracket.all_winners: 1}
+    runners_left = bracket.all_runners
+    for r in range(len(bracket.runners)):
+        runners_left &= ~(1 << r)
+        ways_next = {}
+        for winners_left, n in ways.items():
+            for w in mask_bits(winners_left & bracket.runner_ok[r]):
+                left = winners_left & ~(1 << w)
+                completions = matching_count(bracket, left, runners_left)
+                if completions:
+                    pairing[w, r] += n * completions
+                    ways_next[left] = ways_next.get(left, 0) + n
+        ways = ways_next
+    pairing /= total
+
+    return DrawProbabilities(pairing, 0.0, stuck)
+
+
+# deviation of a procedure from a uniform draw, over the valid draws:
+# - difference: (winners, runners up) pairing probabilities minus uniform ones
+# - max_abs: the largest absolute difference
+# - total_variation: total variation distance between each winner's opponent
+#   probabilities and the uniform ones, averaged over the winners
+DrawBias = namedtuple('DrawBias', ['difference', 'max_abs', 'total_variation'])
+
+
+def draw_bias(last16_df, procedure):
+    bracket = compile_bracket(last16_df)
+    if len(bracket.runners) > DENSE_MAX_RUNNERS:
+        raise ValueError("Draw bias needs at most " + str(DENSE_MAX_RUNNERS) +
+                         " runners up")
+    difference = (draw_probabilities(bracket, procedure).pairing -
+                  uniform_probabilities(bracket).pairing)
+
+    return DrawBias(difference, float(np.abs(difference).max()),
+                    float(np.abs(difference).sum(1).mean() / 2))
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Champions League Draw Algorithm - instrumentation
+
+@author: Sreejith
+"""
+
+import json
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+# instrumentation
+# opt-in counters and timers for the draws, nothing is recorded unless a
+# DrawTrace is active:
+# - the draw functions read `active` once per draw and each eligibility check
+#   once per call, and only call into the trace when it is set, so a disabled
+#   trace costs an attribute lookup
+# - counters: draws, invalid draws and eligibility checks
+# - branches: the step of the draw functions that picked the first club of
+#   each match (1, 1A, 1B, 1C), per procedure and match number
+# - phases: total time of each phase, 'draw' for whole draws, 'score' and
+#   'rescore' for the difficulty ordering of draw_clubs_order, 'lookahead' for
+#   the perfect matching checks of draw_clubs_lookahead, 'batch' for chunks of
+#   draw_batch
+# - errors: procedure, step (matches drawn) and reason of every DrawError
+# - events: Chrome trace events of the draws, phases, branches and errors (up
+#   to max_events of them), for chrome://tracing or Perfetto
+#
+# with tracing() as trace:
+#     draw_clubs_order(group_2021_df)
+# trace.as_dict()
+active = None
+
+
+class DrawTrace:
+
+    def __init__(self, events=True, max_events=1000000):
+        self.counters = Counter()
+        self.branches = {}
+        self.phases = Counter()
+        self.errors = []
+        self.events = [] if events else None
+        self.max_events = max_events
+        self.dropped_events = 0
+        self.procedure = None
+        self.start = time.perf_counter_ns()
+        self.pid = os.getpid()
+
+    @staticmethod
+    def clock():
+        return time.perf_counter_ns()
+
+    def event(self, event):
+        if self.events is None:
+            return
+        if len(self.events) >= self.max_events:
+            self.dropped_events += 1
+            return
+
+        event['ts'] = (event['ts'] - self.start) / 1e3
+        event['pid'] = self.pid
+        event['tid'] = 0
+        self.events.append(event)
+
+    # a phase that started at the given clock() time has ended
+    def phase(self, name, start, args=None):
+        end = time.perf_counter_ns()
+        self.phases[name] += end - start
+        self.event({'name': name, 'cat': 'phase', 'ph': 'X', 'ts': start,
+                    'dur': (end - start) / 1e3, 'args': args or {}})
+
+    # the first club of match `step` was picked by the given branch
+    def branch(self, step, branch):
+        steps = self.branches.setdefault(self.procedure, {}).setdefault(branch, {})
+        steps[step] = steps.get(step, 0) + 1
+        self.event({'name': branch, 'cat': 'branch', 'ph': 'i', 's': 't',
+                    'ts': time.perf_counter_ns(), 'args': {'step': step}})
+
+    def error(self, step, reason):
+        self.errors.append({'procedure': self.procedure, 'step': step,
+                            'reason': reason})
+        self.event({'name': 'DrawError', 'cat': 'error', 'ph': 'i', 's': 't',
+                    'ts': time.perf_counter_ns(),
+                    'args': {'step': step, 'reason': reason}})
+
+    # run one draw of the given procedure, timing it and keeping its error
+    def run_draw(self, procedure, draw, args, kwargs):
+        from .draw import DrawError
+
+        self.procedure = procedure
+        self.counters['draws'] += 1
+        start = time.perf_counter_ns()
+        try:
+            return draw(*args, **kwargs)
+        except DrawError as e:
+            self.counters['invalid'] += 1
+            self.error(e.matches_drawn, str(e))
+            raise
+        finally:
+            self.phase('draw', start, {'procedure': procedure})
+
+    def as_dict(self):
+        return {
+            'counters': dict(self.counters),
+            'branches': {procedure: {branch: dict(sorted(steps.items()))
+                                     for branch, steps in sorted(branches.items())}
+                         for procedure, branches in self.branches.items()},
+            'phases_ms': {name: ns / 1e6 for name, ns in self.phases.items()},
+            'errors': list(self.errors),
+            'dropped_events': self.dropped_events}
+
+    def chrome_trace(self):
+        if self.events is None:
+            raise ValueError("Trace events were not kept - use DrawTrace(events=True)")
+
+        return {'traceEvents': self.events, 'displayTimeUnit': 'ms',
+                'otherData': self.as_dict()}
+
+    def save_chrome_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+
+# make a trace active for the draws run inside the with block
+@contextmanager
+def tracing(trace=None, **kwargs):
+    global active
+    if trace is None:
+        trace = DrawTrace(**kwargs)
+
+    previous = active
+    active = trace
+    try:
+        yield trace
+    finally:
+        active = previous
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Champions League Draw Algorithm - live draw probabilities
+
+@author: Sreejith
+"""
+
+import asyncio
+import json
+
+import numpy as np
+
+from .batch import DENSE_MAX_RUNNERS, bit_tables
+from .bracket import compile_bracket
+from .draw import PROCEDURES
+from .exact import DrawProbabilities, step_probabilities
+
+
+# live draw probabilities
+# during a draw, the pairing probabilities of the clubs left given the pairs
+# already drawn, exact for the chosen procedure:
+# - the pairs drawn only matter through the state they leave (winners and
+#   runners up left), the procedures pick the next club from the state alone
+# - when a LiveDraw is made, the step probabilities of every state (not only
+#   those reachable from the start) and the probability of completing the draw
+#   from each of them are worked out once, as in draw_probabilities
+# - each update is then a forward pass from the current state over the states
+#   it can still reach, and its result is cached by state, so viewers asking
+#   about the same point in the draw share it
+#
+# probabilities returns a DrawProbabilities tuple, conditional on the pairs
+# drawn: the pairs drawn have probability 1, invalid is the probability that
+# the rest of the draw gets stuck and stuck[k] that it does with k matches drawn
+class LiveDraw:
+
+    def __init__(self, last16_df, procedure='random'):
+        if procedure not in PROCEDURES:
+            raise ValueError("Unknown draw procedure: " + str(procedure))
+
+        bracket = compile_bracket(last16_df)
+        m = len(bracket.runners)
+        if len(bracket.winners) != m:
+            raise ValueError("Live draws need as many winners as runners up")
+        if m > DENSE_MAX_RUNNERS:
+            raise ValueError("Live draws need at most " + str(DENSE_MAX_RUNNERS) +
+                             " runners up")
+
+        self.bracket = bracket
+        self.procedure = procedure
+        self.cache = {}
+
+        popcount = bit_tables(m)[0]
+        club_bits = 1 << np.arange(m)
+        pair_bits = (club_bits[:, None] << m) | club_bits[None, :]
+
+        # step probabilities of every state with k matches drawn, and the row
+        # of each state in its layer
+        states = np.arange(1 << 2 * m)
+        runners_n = popcount[states & bracket.all_runners]
+        balanced = runners_n == popcount[states >> m]
+        self.row = np.full(states.size, -1, dtype=np.int64)
+        self.layers = []
+        for k in range(m):
+            layer = states[balanced & (runners_n == m - k)]
+            self.row[layer] = np.arange(layer.size)
+            prob, stuck = step_probabilities(
+                bracket, procedure, k, layer >> m, layer & bracket.all_runners)
+            states_next = np.where(prob > 0, layer[:, None, None] - pair_bits, 0)
+            self.layers.append((prob, stuck, states_next))
+
+        # probability of completing the draw from each state
+        self.complete = np.zeros(states.size)
+        self.complete[0] = 1.0
+        for k in reversed(range(m)):
+            layer = states[balanced & (runners_n == m - k)]
+            prob, stuck, states_next = self.layers[k]
+            self.complete[layer] = (prob * self.complete[states_next]).sum((1, 2))
+
+    # state left by the pairs drawn, given as (runner up, winner) club names
+    def state(self, drawn):
+        bracket = self.bracket
+        winners_left, runners_left = bracket.all_winners, bracket.all_runners
+        for runner, winner in drawn:
+            if bracket.club_code.get(runner, (0,))[0] != 2:
+                raise ValueError("Not a runner up: " + str(runner))
+            if bracket.club_code.get(winner, (0,))[0] != 1:
+                raise ValueError("Not a group winner: " + str(winner))
+
+            r, w = bracket.club_code[runner][1], bracket.club_code[winner][1]
+            if not (runners_left >> r & 1) or not (winners_left >> w & 1):
+                raise ValueError("Already drawn: " + runner + " v " + winner)
+            if not bracket.runner_ok[r] >> w & 1:
+                raise ValueError("Not an eligible pairing: " + runner + " v " + winner)
+
+            winners_left &= ~(1 << w)
+            runners_left &= ~(1 << r)
+
+        return winners_left, runners_left
+
+    def probabilities(self, drawn=()):
+        drawn = list(drawn)
+        winners_left, runners_left = self.state(drawn)
+        key = (winners_left, runners_left)
+        if key not in self.cache:
+            self.cache[key] = self.state_probabilities(winners_left, runners_left)
+
+        # the pairs drawn, on top of the pairings of the clubs left
+        probabilities = self.cache[key]
+        pairing = probabilities.pairing.copy()
+        for runner, winner in drawn:
+            pairing[self.bracket.club_code[winner][1],
+                    self.bracket.club_code[runner][1]] = 1.0
+
+        return DrawProbabilities(pairing, probabilities.invalid,
+                                 probabilities.stuck)
+
+    # forward pass from a state, over the states it can still reach
+    def state_probabilities(self, winners_left, runners_left):
+        m = len(self.bracket.runners)
+        start = winners_left << m | runners_left
+
+        states = np.array([start])
+        reach = np.ones(1)
+        stuck = np.zeros(m)
+        pairing = np.zeros((m, m))
+        for k in range(m - runners_left.bit_count(), m):
+            prob, stuck_k, states_next = self.layers[k]
+            rows = self.row[states]
+            prob, states_next = prob[rows], states_next[rows]
+            stuck[k] = reach @ stuck_k[rows]
+
+            flow = reach[:, None, None] * prob
+            pairing += (flow * self.complete[states_next]).sum(0)
+
+            moves = flow > 0
+            states, index = np.unique(states_next[moves], return_inverse=True)
+            reach = np.bincount(index, weights=flow[moves], minlength=states.size)
+
+        if self.complete[start] > 0:
+            pairing /= self.complete[start]
+
+        return DrawProbabilities(pairing, stuck.sum(), stuck)
+
+
+# live draw service
+# a small HTTP server on asyncio streams for showing a draw to many viewers:
+# - GET /probabilities: the probabilities given the pairs drawn so far, JSON
+# - GET /events: a server-sent event stream of the same, one event per update
+# - POST /draw with {"runner": ..., "winner": ...}: a pair has been drawn
+# - POST /undo, POST /reset: take back the last pair, or all of them
+# each update is worked out once, in a worker thread so that the event loop
+# keeps serving, and the same JSON is sent to every viewer; updates take the
+# pairs drawn as they are once the update before has finished, so requests
+# sent at the same time all count
+class LiveDrawService:
+
+    def __init__(self, live):
+        self.live = live
+        self.drawn = []
+        self.version = 0
+        self.payload = self.encode(live.probabilities())
+        self.lock = asyncio.Lock()
+        self.updated = asyncio.Condition()
+
+    def encode(self, probabilities):
+        bracket = self.live.bracket
+        return json.dumps({
+            'procedure': self.live.procedure,
+            'drawn': self.drawn,
+            'invalid': probabilities.invalid,
+            'pairing': {winner: {runner: probabilities.pairing[i, j]
+                                 for j, runner in enumerate(bracket.runners)}
+                        for i, winner in enumerate(bracket.winners)}}).encode()
+
+    # change maps the pairs drawn so far to the new ones
+    async def update(self, change):
+        async with self.lock:
+            drawn = change(self.drawn)
+            probabilities = await asyncio.to_thread(self.live.probabilities, drawn)
+            self.drawn = drawn
+            self.payload = self.encode(probabilities)
+            async with self.updated:
+                self.version += 1
+                self.updated.notify_all()
+
+            return self.payload
+
+    async def respond(self, method, path, body):
+        if (method, path) == ('GET', '/probabilities'):
+            return 200, self.payload
+
+        if (method, path) == ('POST', '/draw'):
+            pair = json.loads(body or b'{}')
+            if not isinstance(pair, dict) or not all(
+                    isinstance(pair.get(k), str) for k in ('runner', 'winner')):
+                raise ValueError("A draw needs a runner and a winner name")
+            def change(drawn):
+                return drawn + [[pair['runner'], pair['winner']]]
+        elif (method, path) == ('POST', '/undo'):
+            def change(drawn):
+                return drawn[:-1]
+        elif (method, path) == ('POST', '/reset'):
+            def change(drawn):
+                return []
+        else:
+            return 404, json.dumps({'error': 'Not found: ' + method + ' ' + path}).encode()
+
+        return 200, await self.update(change)
+
+    async def stream(self, writer):
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n'
+                     b'Cache-Control: no-cache\r\nConnection: keep-alive\r\n\r\n')
+        version = None
+        while True:
+            async with self.updated:
+                await self.updated.wait_for(lambda: self.version != version)
+                version, payload = self.version, self.payload
+            writer.write(b'data: ' + payload + b'\n\n')
+            await writer.drain()
+
+    async def handle(self, reader, writer):
+        try:
+            method, path, _ = (await reader.readline()).decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line.strip() == b'':
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+            if (method, path) == ('GET', '/events'):
+                await self.stream(writer)
+                return
+
+            try:
+                status, payload = await self.respond(method, path, body)
+            except ValueError as e:
+                status, payload = 400, json.dumps({'error': str(e)}).encode()
+
+            writer.write(b'HTTP/1.1 %d %s\r\nContent-Type: application/json\r\n'
+                         b'Content-Length: %d\r\nConnection: close\r\n\r\n' %
+                         (status, b'OK' if status == 200 else b'Error', len(payload)))
+            writer.write(payload)
+            await writer.drain()
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(live, host='127.0.0.1', port=8016):
+    service = LiveDrawService(live)
+    server = await asyncio.start_server(service.handle, host, port)
+    async with server:
+        await server.serve_forever()
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Champions League Draw Algorithm - parallel simulation
+
+@author: Sreejith
+"""
+
+import os
+from collections import namedtuple
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from .bracket import (bracket_arrays, bracket_from_arrays,
+                      compile_bracket)
+from .draw import DRAW_FUNCTIONS, DrawError
+
+
+# parallel simulation
+# shards the draws of one of the draw functions over a process pool:
+# - the compiled standings are copied once into shared memory, every worker
+#   reads them from there when it starts instead of receiving them with tasks
+# - the draws are cut into fixed size shards, draw i is made with
+#   draw_rng(seed, i) whatever shard it falls in, so a root seed gives the same
+#   totals whatever the number of workers or the shard size, and any one draw
+#   can be made again with draw_index=i
+# - each shard returns count arrays that are added up at the end
+#
+# simulate_draws returns a SimulationCounts tuple:
+# - draws: number of draws
+# - pairing: (winners, runners up) number of valid draws with each pairing
+# - invalid: number of invalid draws
+# - stuck: number of draws stuck with 0, 1, ... matches drawn
+# - seed: root seed of the draws (drawn from fresh entropy if not given)
+SimulationCounts = namedtuple('SimulationCounts',
+                              ['draws', 'pairing', 'invalid', 'stuck', 'seed'])
+
+simulate_worker = {}
+
+
+# copy arrays into one shared memory block, returns the block and the layout
+# (name, dtype, shape, offset) needed to read them back
+def share_arrays(arrays):
+    layout = []
+    size = 0
+    for name, a in arrays.items():
+        layout.append((name, a.dtype.str, a.shape, size))
+        size += -(-a.nbytes // 8) * 8
+
+    shm = SharedMemory(create=True, size=max(size, 1))
+    for (name, dtype, shape, offset), a in zip(layout, arrays.values()):
+        np.ndarray(shape, dtype, buffer=shm.buf, offset=offset)[...] = a
+
+    return shm, layout
+
+
+def simulate_worker_init(shm_name, layout):
+    shm = SharedMemory(name=shm_name)
+    arrays = {name: np.ndarray(shape, dtype, buffer=shm.buf, offset=offset)
+              for name, dtype, shape, offset in layout}
+    simulate_worker['bracket'] = bracket_from_arrays(arrays)
+    del arrays
+    shm.close()
+
+
+def simulate_shard(procedure, start, n, seed):
+    bracket = simulate_worker['bracket']
+    draw = DRAW_FUNCTIONS[procedure]
+
+    pairing = np.zeros((len(bracket.winners), len(bracket.runners)), dtype=np.int64)
+    stuck = np.zeros(len(bracket.runners), dtype=np.int64)
+    for i in range(start, start + n):
+        try:
+            state = draw(bracket, seed, as_frame=False, draw_index=i)
+        except DrawError as e:
+            stuck[e.matches_drawn] += 1
+        else:
+            pairing[state.winner, state.runner] += 1
+
+    return pairing, stuck
+
+
+def simulate_shard_task(task):
+    return simulate_shard(*task)
+
+
+def simulate_draws(last16_df, procedure, n, seed=None, workers=None,
+                   shard_size=1000):
+    # procedure is a draw function or its name in DRAW_FUNCTIONS
+    names = {f: p for p, f in DRAW_FUNCTIONS.items()}
+    procedure = names.get(procedure, procedure)
+    if procedure not in DRAW_FUNCTIONS:
+        raise ValueError("Unknown draw procedure: " + str(procedure))
+
+    bracket = compile_bracket(last16_df)
+    if workers is None:
+        workers = os.cpu_count()
+
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    tasks = [(procedure, start, min(shard_size, n - start), seed)
+             for start in range(0, n, shard_size)]
+
+    pairing = np.zeros((len(bracket.winners), len(bracket.runners)), dtype=np.int64)
+    stuck = np.zeros(len(bracket.runners), dtype=np.int64)
+
+    shm, layout = share_arrays(bracket_arrays(bracket))
+    try:
+        with Pool(workers, simulate_worker_init, (shm.name, layout)) as pool:
+            for shard_pairing, shard_stuck in pool.imap_unordered(
+                    simulate_shard_task, tasks):
+                pairing += shard_pairing
+                stuck += shard_stuck
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return SimulationCounts(n, pairing, int(stuck.sum()), stuck, seed)
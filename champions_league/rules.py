@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Champions League Draw Algorithm - rule variants
+
+@author: Sreejith
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from .bracket import (bracket_arrays, bracket_from_arrays, compile_bracket,
+                      matrix_masks)
+from .exact import draw_probabilities
+
+
+# rule variants
+# the eligibility rules as data, so that what-if questions need no new code,
+# a variant is a dict of any of:
+# - name: shown in reports
+# - group: clubs of the same group cannot meet (default True)
+# - country: clubs of the same country (association) cannot meet (default True)
+# - pot: clubs only meet clubs of the same pot (default True)
+# - separate: lists of countries whose clubs cannot meet each other, e.g.
+#   [['Rus', 'Ukr']], named as in the standings' country column (counted as
+#   country protection in error messages)
+# - forbid: (winner, runner up) pairs of clubs that cannot be drawn, in
+#   either order, e.g. TV pairings or two clubs sharing a stadium
+#
+# compile_rules gives a Bracket with the eligibility masks of the variant, the
+# draw functions and the batch, exact and parallel engines take it in place of
+# the standings, the 1A/1B/1C steps still follow the clubs' groups and countries
+RULES = {'name': 'baseline', 'group': True, 'country': True, 'pot': True,
+         'separate': (), 'forbid': ()}
+
+
+def compile_rules(last16_df, variant=None):
+    rules = dict(RULES)
+    for key, value in (variant or {}).items():
+        if key not in RULES:
+            raise ValueError("Unknown rule: " + str(key))
+        rules[key] = value
+
+    # a new bracket, so that no cached checks of the standard rules are kept
+    bracket = bracket_from_arrays(bracket_arrays(compile_bracket(last16_df)))
+
+    separated = set()
+    for countries in rules['separate']:
+        for country in countries:
+            if country not in bracket.countries:
+                raise ValueError("Unknown country: " + str(country))
+        for a in countries:
+            for b in countries:
+                if a != b:
+                    separated.add((a, b))
+
+    forbidden = set()
+    for a, b in rules['forbid']:
+        for club in (a, b):
+            if club not in bracket.club_code:
+                raise ValueError("Unknown club: " + str(club))
+        if {bracket.club_code[a][0], bracket.club_code[b][0]} != {1, 2}:
+            raise ValueError("Not a winner and a runner up: " + str(a) +
+                             " v " + str(b))
+        if bracket.club_code[a][0] == 2:
+            a, b = b, a
+        forbidden.add((a, b))
+
+    # (winner, runner up) masks of each rule
+    w, m = len(bracket.winners), len(bracket.runners)
+    country_ok = np.ones((w, m), dtype=bool)
+    group_ok = np.ones((w, m), dtype=bool)
+    pot_ok = np.ones((w, m), dtype=bool)
+    pairing_ok = np.ones((w, m), dtype=bool)
+    winner_country = np.array([bracket.countries[c] for c in bracket.winner_country])
+    runner_country = np.array([bracket.countries[c] for c in bracket.runner_country])
+    if rules['country']:
+        country_ok &= winner_country[:, None] != runner_country[None, :]
+    for a, b in separated:
+        country_ok &= ~((winner_country[:, None] == a) & (runner_country[None, :] == b))
+    if rules['group']:
+        group_ok &= (np.array(bracket.winner_group)[:, None] !=
+                     np.array(bracket.runner_group)[None, :])
+    if rules['pot']:
+        pot_ok &= (np.array(bracket.winner_pot)[:, None] ==
+                   np.array(bracket.runner_pot)[None, :])
+    for a, b in forbidden:
+        pairing_ok[bracket.club_code[a][1], bracket.club_code[b][1]] = False
+
+    bracket.runner_country_ok, bracket.winner_country_ok = matrix_masks(country_ok)
+    bracket.runner_group_ok, bracket.winner_group_ok = matrix_masks(group_ok)
+    bracket.runner_pot_ok, bracket.winner_pot_ok = matrix_masks(pot_ok)
+    bracket.runner_ok, bracket.winner_ok = matrix_masks(
+        country_ok & group_ok & pot_ok & pairing_ok)
+
+    return bracket
+
+
+# exact what-if report of a list of variants against the standard rules,
+# returns the DrawProbabilities of the standard rules and a VariantReport for
+# each variant:
+# - name, probabilities: the variant's DrawProbabilities
+# - invalid_change: change in the probability that the draw gets stuck
+# - shift: (winners, runners up) change in each pairing probability
+# - max_shift, total_variation: largest change and total variation distance
+#   of the pairings, averaged over the winners as in draw_bias
+VariantReport = namedtuple('VariantReport',
+                           ['name', 'probabilities', 'invalid_change', 'shift',
+                            'max_shift', 'total_variation'])
+
+
+def compare_variants(last16_df, variants, procedure='random'):
+    baseline = draw_probabilities(compile_rules(last16_df), procedure)
+
+    reports = []
+    for k, variant in enumerate(variants):
+        probabilities = draw_probabilities(compile_rules(last16_df, variant),
+                                           procedure)
+        shift = probabilities.pairing - baseline.pairing
+        reports.append(VariantReport(
+            variant.get('name', 'variant ' + str(k + 1)), probabilities,
+            probabilities.invalid - baseline.invalid, shift,
+            float(np.abs(shift).max()), float(np.abs(shift).sum(1).mean() / 2)))
+
+    return baseline, reports
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+Champions League Draw Algorithm - final matchday scenarios
+
+@author: Sreejith
+"""
+
+import itertools
+import os
+from collections import Counter, namedtuple
+from multiprocessing import Pool
+
+import numpy as np
+
+from .bracket import compile_bracket
+from .draw import PROCEDURES
+from .exact import draw_probabilities
+
+
+# final matchday scenarios
+# before the last matchday, the clubs still in contention in each group can
+# finish first or second in several ways, each combination is a scenario:
+# - the contenders are given as standings without (or ignoring) the finish
+#   column, every ordered pair of contenders of a group is a way for it to
+#   finish, 2 clubs in each of 8 groups give 2^8 = 256 scenarios
+# - odds optionally gives {group: {(first, second): probability}}, groups
+#   left out have their orders equally likely, scenarios are weighted by the
+#   product over groups
+# - each scenario is solved exactly with draw_probabilities, but only once for
+#   each canonical form of its standings (see canonical_form): scenarios that
+#   only differ by which clubs, groups and countries are where share it
+# - the canonical standings left to solve are spread over a process pool
+#
+# sweep_scenarios returns a ScenarioSweep tuple:
+# - scenarios: a Scenario tuple per scenario, its standings, weight, the
+#   canonical signature of its standings and its DrawProbabilities
+# - clubs: every contender
+# - pairing: (clubs, clubs) probability that two clubs meet over all
+#   scenarios, in a valid draw
+# - invalid: probability that the draw gets stuck over all scenarios
+# - solved: number of canonical standings solved for the sweep
+Scenario = namedtuple('Scenario',
+                      ['standings', 'weight', 'signature', 'probabilities'])
+ScenarioSweep = namedtuple('ScenarioSweep',
+                           ['scenarios', 'clubs', 'pairing', 'invalid', 'solved'])
+
+# DrawProbabilities of canonical standings, by (procedure, signature)
+solved_scenarios = {}
+
+
+def scenario_standings(contenders, odds=None):
+    if 'group' not in contenders:
+        raise ValueError("Scenarios need the contenders of each group - the "
+                         "standings have no group column")
+    club = list(contenders['club'])
+    group = list(contenders['group'])
+    rules = [name for name in ('country', 'pot') if name in contenders]
+    columns = {name: list(contenders[name]) for name in rules}
+
+    groups = {}
+    for row, g in enumerate(group):
+        groups.setdefault(g, []).append(row)
+
+    # ways each group can finish, as (first row, second row, probability)
+    finishes = []
+    for g, rows in groups.items():
+        if len(rows) < 2:
+            raise ValueError("Group " + str(g) + " needs at least 2 contenders")
+        orders = list(itertools.permutations(rows, 2))
+        group_odds = (odds or {}).get(g)
+        if group_odds is None:
+            finishes.append([(a, b, 1 / len(orders)) for a, b in orders])
+        else:
+            finishes.append([(a, b, group_odds.get((club[a], club[b]), 0.0))
+                             for a, b in orders])
+
+    for finish in itertools.product(*finishes):
+        weight = float(np.prod([p for a, b, p in finish]))
+        if weight == 0:
+            continue
+
+        rows = [row for a, b, p in finish for row in (a, b)]
+        standings = {'club': [club[row] for row in rows],
+                     'group': [group[row] for row in rows],
+                     'finish': [1, 2] * len(finish)}
+        for name in rules:
+            standings[name] = [columns[name][row] for row in rows]
+
+        yield standings, weight
+
+
+# canonical form of a compiled bracket
+# the clubs, groups, countries and pots are the vertices of a graph, each club
+# joined to its group, country and pot, and two brackets draw alike when their
+# graphs are isomorphic (keeping winners, runners up, groups, countries and
+# pots apart), as every procedure treats clubs alike up to their eligibility:
+# - colour refinement splits the vertices by their colour and the colours of
+#   their neighbours until the split is stable
+# - ties left (vertices no refinement can tell apart) are broken by trying
+#   each vertex of the first tied cell in turn, refining again, down to a
+#   colouring with one vertex per colour
+# - the signature is the smallest graph, numbered by such a colouring, over
+#   the tries, so isomorphic brackets share it
+# - two tries giving the same graph show a symmetry of the bracket, and tries
+#   that a known symmetry maps onto one already made are skipped, so brackets
+#   of interchangeable groups do not try every order of them
+#
+# returns the signature and the canonical position of each winner and runner
+# up among the winners and runners up of the signature
+def canonical_form(bracket):
+    clubs = ([(1, g, c, p) for g, c, p in zip(
+                 bracket.winner_group, bracket.winner_country, bracket.winner_pot)] +
+             [(2, g, c, p) for g, c, p in zip(
+                 bracket.runner_group, bracket.runner_country, bracket.runner_pot)])
+    label_counts = (len(bracket.groups), len(bracket.countries), len(bracket.pots))
+    first_label = [len(clubs) + sum(label_counts[:kind]) for kind in range(3)]
+
+    kinds = [finish for finish, *codes in clubs]
+    neighbours = [[] for _ in range(len(clubs) + sum(label_counts))]
+    for kind, count in enumerate(label_counts):
+        kinds += [3 + kind] * count
+    for v, (finish, *codes) in enumerate(clubs):
+        for kind, code in enumerate(codes):
+            u = first_label[kind] + code
+            neighbours[v].append(u)
+            neighbours[u].append(v)
+
+    def refine(colours):
+        while True:
+            keys = [(colours[v], tuple(sorted(colours[u] for u in neighbours[v])))
+                    for v in range(len(colours))]
+            ranks = {key: k for k, key in enumerate(sorted(set(keys)))}
+            refined = [ranks[key] for key in keys]
+            if len(ranks) == len(set(colours)):
+                return refined
+            colours = refined
+
+    def graph(colours):
+        return tuple(sorted((colours[v], kinds[v],
+                             tuple(sorted(colours[u] for u in neighbours[v])))
+                            for v in range(len(colours))))
+
+    best = {}
+    symmetries = []
+
+    def orbit(v, fixed):
+        # vertices the symmetries fixing the tries made so far map v onto
+        found, todo = {v}, [v]
+        maps = [s for s in symmetries if all(s[u] == u for u in fixed)]
+        while todo:
+            u = todo.pop()
+            for s in maps:
+                if s[u] not in found:
+                    found.add(s[u])
+                    todo.append(s[u])
+        return found
+
+    def search(colours, fixed):
+        colours = refine(colours)
+        cells = Counter(colours)
+        tied = [c for c, n in cells.items() if n > 1]
+        if not tied:
+            leaf = graph(colours)
+            if not best or leaf < best['graph']:
+                best.update(graph=leaf, colours=colours)
+            elif leaf == best['graph']:
+                vertex = {c: v for v, c in enumerate(best['colours'])}
+                symmetries.append([vertex[c] for c in colours])
+            return
+
+        cell = min(tied)
+        tried = []
+        for v in [v for v, c in enumerate(colours) if c == cell]:
+            if any(u in orbit(v, fixed) for u in tried):
+                continue
+            search([2 * c + (c == cell and u != v) for u, c in enumerate(colours)],
+                   fixed + [v])
+            tried.append(v)
+
+    search(list(kinds), [])
+
+    colours = best['colours']
+    w = len(bracket.winners)
+    winner_rank = sorted(range(w), key=lambda i: colours[i])
+    runner_rank = sorted(range(len(clubs) - w), key=lambda j: colours[w + j])
+    winner_pos = np.argsort(winner_rank)
+    runner_pos = np.argsort(runner_rank)
+
+    return best['graph'], winner_pos, runner_pos
+
+
+# standings of a canonical signature, clubs numbered by their colour
+def signature_standings(signature):
+    colour_vertex = {colour: k for k, (colour, kind, near) in enumerate(signature)}
+    standings = {'club': [], 'group': [], 'finish': [], 'country': [], 'pot': []}
+    for colour, kind, near in signature:
+        if kind > 2:
+            continue
+        labels = {signature[colour_vertex[u]][1]: u for u in near}
+        standings['club'].append('club %d' % colour)
+        standings['finish'].append(kind)
+        standings['group'].append(labels[3])
+        standings['country'].append(labels[4])
+        standings['pot'].append(labels[5])
+
+    return standings
+
+
+def solve_signature(task):
+    procedure, signature = task
+    return draw_probabilities(signature_standings(signature), procedure)
+
+
+def sweep_scenarios(contenders, procedure='random', odds=None, workers=None):
+    if procedure not in PROCEDURES:
+        raise ValueError("Unknown draw procedure: " + str(procedure))
+
+    scenarios = []
+    for standings, weight in scenario_standings(contenders, odds):
+        bracket = compile_bracket(standings)
+        signature, winner_pos, runner_pos = canonical_form(bracket)
+        scenarios.append((standings, weight, bracket, signature,
+                          winner_pos, runner_pos))
+
+    # solve each canonical standings not solved before, once
+    todo = sorted({(procedure, s[3]) for s in scenarios} - set(solved_scenarios))
+    if workers is None:
+        workers = os.cpu_count()
+    if workers > 1 and len(todo) > 1:
+        with Pool(min(workers, len(todo))) as pool:
+            solved = pool.map(solve_signature, todo)
+    else:
+        solved = [solve_signature(task) for task in todo]
+    solved_scenarios.update(zip(todo, solved))
+
+    clubs = list(dict.fromkeys(contenders['club']))
+    club_code = {c: k for k, c in enumerate(clubs)}
+    total = sum(s[1] for s in scenarios)
+    pairing = np.zeros((len(clubs), len(clubs)))
+    invalid = 0.0
+    results = []
+    for standings, weight, bracket, signature, winner_pos, runner_pos in scenarios:
+        canonical = solved_scenarios[procedure, signature]
+        probabilities = canonical._replace(
+            pairing=canonical.pairing[np.ix_(winner_pos, runner_pos)])
+        results.append(Scenario(standings, weight / total, signature,
+                                probabilities))
+
+        w = [club_code[c] for c in bracket.winners]
+        r = [club_code[c] for c in bracket.runners]
+        pairing[np.ix_(w, r)] += weight / total * probabilities.pairing
+        invalid += weight / total * probabilities.invalid
+
+    return ScenarioSweep(results, clubs, pairing + pairing.T, invalid,
+                         len(todo))
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Champions League Draw Algorithm - standings files
+
+@author: Sreejith
+"""
+
+import csv
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from .batch import DENSE_MAX_RUNNERS, endgame_table, matching_counts
+from .bracket import bracket_arrays, bracket_from_arrays, compile_bracket
+
+
+# club and country registry
+# the names the standings files are checked against: each club's country, and
+# misspellings seen in past standings with the name they stand for
+COUNTRIES = {
+    'Aut': 'Austria', 'Bel': 'Belgium', 'Cro': 'Croatia', 'Cze': 'Czechia',
+    'Den': 'Denmark', 'Eng': 'England', 'Esp': 'Spain', 'Fra': 'France',
+    'Ger': 'Germany', 'Gre': 'Greece', 'Ita': 'Italy', 'Ned': 'Netherlands',
+    'Nor': 'Norway', 'Por': 'Portugal', 'Rus': 'Russia', 'Sco': 'Scotland',
+    'Srb': 'Serbia', 'Sui': 'Switzerland', 'Swe': 'Sweden', 'Tur': 'Turkey',
+    'Ukr': 'Ukraine'}
+
+CLUB_COUNTRIES = {
+    'AC Milan': 'Ita', 'Ajax': 'Ned', 'Arsenal': 'Eng', 'Aston Villa': 'Eng',
+    'Atalanta': 'Ita', 'Atletico Madrid': 'Esp', 'Barcelona': 'Esp',
+    'Bayer Leverkusen': 'Ger', 'Bayern Munich': 'Ger', 'Benfica': 'Por',
+    'Borussia Dortmund': 'Ger', 'Brest': 'Fra', 'Celtic': 'Sco',
+    'Chelsea': 'Eng', 'Club Brugge': 'Bel', 'FC Salzburg': 'Aut',
+    'Feyenoord': 'Ned', 'Inter Milan': 'Ita', 'Juventus': 'Ita',
+    'Lazio': 'Ita', 'Lille OSC': 'Fra', 'Liverpool': 'Eng',
+    'Manchester City': 'Eng', 'Manchester United': 'Eng', 'Monaco': 'Fra',
+    'Monchengladbach': 'Ger', 'PSV Eindhoven': 'Ned',
+    'Paris Saint-Germain': 'Fra', 'Porto': 'Por', 'RB Leipzig': 'Ger',
+    'Real Madrid': 'Esp', 'Sevilla': 'Esp', 'Sporting CP Lisbon': 'Por',
+    'Villarreal': 'Esp'}
+
+CLUB_ALIASES = {
+    'Machester City': 'Manchester City', 'Benfrica': 'Benfica',
+    'Man City': 'Manchester City', 'Man United': 'Manchester United',
+    'PSG': 'Paris Saint-Germain', 'Inter': 'Inter Milan',
+    'Atletico de Madrid': 'Atletico Madrid', 'Salzburg': 'FC Salzburg',
+    'Sporting CP': 'Sporting CP Lisbon', 'Lille': 'Lille OSC',
+    'Borussia Monchengladbach': 'Monchengladbach', 'Dortmund': 'Borussia Dortmund'}
+
+
+# standings check
+# renames misspelt clubs, and checks every club's country against the
+# registry (correcting it when the club is known) and every country against
+# COUNTRIES, returns the checked standings and a list of what was changed or
+# is unknown, strict raises ValueError on unknown clubs and countries instead
+def check_standings(standings, strict=False):
+    standings = {name: list(values) for name, values in standings.items()}
+    issues = []
+
+    for k, club in enumerate(standings['club']):
+        if club in CLUB_ALIASES:
+            standings['club'][k] = CLUB_ALIASES[club]
+            issues.append("Renamed " + club + " to " + CLUB_ALIASES[club])
+        elif club not in CLUB_COUNTRIES:
+            if strict:
+                raise ValueError("Unknown club: " + str(club))
+            issues.append("Unknown club: " + str(club))
+
+    if 'country' in standings:
+        for k, (club, country) in enumerate(zip(standings['club'],
+                                                standings['country'])):
+            known = CLUB_COUNTRIES.get(club)
+            if (known is not None) & (known != country):
+                standings['country'][k] = known
+                issues.append("Corrected the country of " + club + " from " +
+                              str(country) + " to " + known)
+            elif country not in COUNTRIES:
+                if strict:
+                    raise ValueError("Unknown country: " + str(country))
+                issues.append("Unknown country: " + str(country))
+
+    if len(set(standings['club'])) != len(standings['club']):
+        raise ValueError("Clubs listed twice in the standings")
+
+    return standings, issues
+
+
+# one standings file as a dict of columns:
+# - CSV with a header row of column names (club, finish and the optional
+#   group, country and pot)
+# - JSON as a dict of columns, like the standings in standings.py, or a list
+#   of rows
+def read_standings(path):
+    if path.endswith('.json'):
+        with open(path) as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            data = {name: [row.get(name) for row in data] for name in data[0]}
+    else:
+        with open(path, newline='') as f:
+            rows = list(csv.DictReader(f))
+        data = {name: [row[name] for row in rows] for name in rows[0]}
+
+    standings = {name: list(data[name]) for name in
+                 ('club', 'group', 'finish', 'country', 'pot') if name in data}
+    standings['finish'] = [int(f) for f in standings['finish']]
+    if 'pot' in standings:
+        standings['pot'] = [int(p) if str(p).isdigit() else p
+                            for p in standings['pot']]
+
+    return standings
+
+
+# bulk loading
+# load_seasons reads every .csv and .json file of a directory (one season or
+# competition each, named after the file), checks it and compiles it, with the
+# matching and 1C tables of the batch and exact engines for brackets they can
+# take:
+# - the compiled bracket is cached as .npz (bracket_arrays plus the tables),
+#   keyed by a hash of the file and the registry, so a season is only parsed
+#   and compiled again when its file (or the registry) changes
+# - cache_dir defaults to a .bracket_cache directory next to the files
+#
+# returns a LoadedSeasons tuple:
+# - brackets: compiled Bracket of each season, by name
+# - issues: what check_standings changed or found unknown, by season
+# - cached: seasons read from the cache
+LoadedSeasons = namedtuple('LoadedSeasons', ['brackets', 'issues', 'cached'])
+
+# bumped when the cached arrays change
+CACHE_FORMAT = 1
+
+
+def registry_hash():
+    registry = json.dumps([CACHE_FORMAT, COUNTRIES, CLUB_COUNTRIES, CLUB_ALIASES],
+                          sort_keys=True)
+    return hashlib.sha256(registry.encode()).hexdigest()
+
+
+def load_seasons(directory, cache_dir=None, strict=False):
+    if cache_dir is None:
+        cache_dir = os.path.join(directory, '.bracket_cache')
+    os.makedirs(cache_dir, exist_ok=True)
+    registry = registry_hash()
+
+    loaded = LoadedSeasons({}, {}, [])
+    for name in sorted(os.listdir(directory)):
+        season, ext = os.path.splitext(name)
+        if ext not in ('.csv', '.json'):
+            continue
+        path = os.path.join(directory, name)
+
+        with open(path, 'rb') as f:
+            key = hashlib.sha256(registry.encode() + f.read()).hexdigest()
+        cache_path = os.path.join(cache_dir, season + '-' + key[:20] + '.npz')
+
+        if os.path.exists(cache_path):
+            with np.load(cache_path) as arrays:
+                arrays = dict(arrays)
+            bracket = bracket_from_arrays(arrays)
+            if 'matching_states' in arrays:
+                bracket.matching_states = arrays['matching_states']
+                bracket.endgame_states = arrays['endgame_states']
+            issues = arrays['issues'].tolist()
+            loaded.cached.append(season)
+        else:
+            standings, issues = check_standings(read_standings(path), strict)
+            bracket = compile_bracket(standings)
+            arrays = bracket_arrays(bracket)
+            if (len(bracket.winners) == len(bracket.runners)) & \
+                    (len(bracket.runners) <= DENSE_MAX_RUNNERS):
+                arrays['matching_states'] = matching_counts(bracket)
+                arrays['endgame_states'] = endgame_table(bracket)
+            arrays['issues'] = np.array(issues, dtype=str)
+            # brackets of earlier versions of the file are dropped
+            for old in os.listdir(cache_dir):
+                if old.rsplit('-', 1)[0] == season:
+                    os.remove(os.path.join(cache_dir, old))
+            np.savez_compressed(cache_path, **arrays)
+
+        loaded.brackets[season] = bracket
+        loaded.issues[season] = issues
+
+    return loaded
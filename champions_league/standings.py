@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Champions League Draw Algorithm - standings
+
+@author: Sreejith
+"""
+
+
+# 2021 results of group stages
+# variables of the dataframe:
+# - club name
+# - round of 32 group
+# - position where the club finished in the group stages (winner = 1, runners up = 2)
+# - which football association the club belongs to
+standings_2021 = {
+    'club': ['Manchester City', 'Paris Saint-Germain',
+             'Liverpool', 'Atletico Madrid',
+             'Ajax', 'Sporting CP Lisbon',
+             'Real Madrid', 'Inter Milan',
+             'Bayern Munich', 'Benfica',
+             'Manchester United', 'Villarreal',
+             'Lille OSC', 'FC Salzburg',
+             'Juventus', 'Chelsea'],
+
+    'group': ['A', 'A', 'B', 'B', 'C', 'C', 'D', 'D',
+              'E', 'E', 'F', 'F', 'G', 'G', 'H', 'H'],
+
+    'finish': [1, 2, 1, 2, 1, 2, 1, 2, 1, 2, 1, 2, 1, 2, 1, 2],
+
+    'country': ['Eng', 'Fra',
+                'Eng', 'Esp',
+                'Ned', 'Por',
+                'Esp', 'Ita',
+                'Ger', 'Por',
+                'Eng', 'Esp',
+                'Fra', 'Aut',
+                'Ita', 'Eng']
+}
+
+# 2020 results of group stages
+standings_2020 = {
+    'club': ['Bayern Munich', 'Atletico Madrid',
+             'Real Madrid', 'Monchengladbach',
+             'Manchester City', 'Porto',
+             'Liverpool', 'Atalanta',
+             'Chelsea', 'Sevilla',
+             'Borussia Dortmund', 'Lazio',
+             'Juventus', 'Barcelona',
+             'Paris Saint-Germain', 'RB Leipzig'],
+
+    'group': ['A', 'A', 'B', 'B', 'C', 'C', 'D', 'D',
+              'E', 'E', 'F', 'F', 'G', 'G', 'H', 'H'],
+
+    'finish': [1, 2, 1, 2, 1, 2, 1, 2, 1, 2, 1, 2, 1, 2, 1, 2],
+
+    'country': ['Ger', 'Esp',
+                'Esp', 'Ger',
+                'Eng', 'Por',
+                'Eng', 'Ita',
+                'Eng', 'Esp',
+                'Ger', 'Ita',
+                'Ita', 'Esp',
+                'Fra', 'Ger']
+}
+
+# synthetic worst-case standings for benchmarks
+# found by searching random country assignments for the highest invalid rate
+# that still leaves a valid draw, six of the eight runners up are Italian:
+# 85.3% draw_clubs, 83.3% draw_clubs_country, 57.6% draw_clubs_country_alt,
+# 31.9% draw_clubs_order
+standings_worst = {
+    'club': ['Club A1', 'Club A2', 'Club B1', 'Club B2',
+             'Club C1', 'Club C2', 'Club D1', 'Club D2',
+             'Club E1', 'Club E2', 'Club F1', 'Club F2',
+             'Club G1', 'Club G2', 'Club H1', 'Club H2'],
+
+    'group': ['A', 'A', 'B', 'B', 'C', 'C', 'D', 'D',
+              'E', 'E', 'F', 'F', 'G', 'G', 'H', 'H'],
+
+    'finish': [1, 2, 1, 2, 1, 2, 1, 2, 1, 2, 1, 2, 1, 2, 1, 2],
+
+    'country': ['Fra', 'Ita',
+                'Fra', 'Ita',
+                'Ita', 'Ita',
+                'Eng', 'Esp',
+                'Esp', 'Ita',
+                'Ger', 'Ita',
+                'Fra', 'Ita',
+                'Ita', 'Esp']
+}
+
+
+# league-phase knockout play-offs (from 2024/25)
+# clubs 9-16 of the league phase are seeded (finish 1) and play clubs 17-24
+# (finish 2), in pots of two seeded and two unseeded clubs: 9/10 play 23/24,
+# 11/12 play 21/22, 13/14 play 19/20 and 15/16 play 17/18
+# there is no group or country protection, so the standings only have a pot
+def league_phase_playoff(table):
+    standings = {'club': [], 'finish': [], 'pot': []}
+    for position in range(9, 25):
+        seeded = position <= 16
+        standings['club'].append(table[position - 1])
+        standings['finish'].append(1 if seeded else 2)
+        standings['pot'].append((position - 7) // 2 if seeded else (26 - position) // 2)
+
+    return standings
+
+
+# 2024/25 league phase table, places 1-24
+league_phase_2025 = [
+    'Liverpool', 'Barcelona', 'Arsenal', 'Inter Milan',
+    'Atletico Madrid', 'Bayer Leverkusen', 'Lille OSC', 'Aston Villa',
+    'Atalanta', 'Borussia Dortmund', 'Real Madrid', 'Bayern Munich',
+    'AC Milan', 'PSV Eindhoven', 'Paris Saint-Germain', 'Benfica',
+    'Monaco', 'Brest', 'Feyenoord', 'Juventus',
+    'Celtic', 'Manchester City', 'Sporting CP Lisbon', 'Club Brugge']
+
+
+# synthetic standings of any size for stress tests, one winner and one runner
+# up in each of `groups` groups, the clubs' countries drawn at random from
+# `countries` of them (by default one per two groups)
+def synthetic_standings(groups, countries=None, seed=None):
+    import random
+
+    rng = random.Random(seed)
+    if countries is None:
+        countries = max(groups // 2, 2)
+
+    standings = {'club': [], 'group': [], 'finish': [], 'country': []}
+    for g in range(groups):
+        for finish in (1, 2):
+            standings['club'].append('Club %d.%d' % (g + 1, finish))
+            standings['group'].append('G%d' % (g + 1))
+            standings['finish'].append(finish)
+            standings['country'].append('C%d' % rng.randrange(countries))
+
+    return standings
+
+
+# standings by season
+STANDINGS = {
+    '2021': standings_2021,
+    '2020': standings_2020,
+    'worst': standings_worst,
+    'playoff_2025': league_phase_playoff(league_phase_2025)}
+
+
+# the standings as DataFrames are only built (and pandas imported) when first
+# asked for, e.g. champions_league.standings.group_2021_df
+def __getattr__(name):
+    frames = {'group_2021_df': standings_2021, 'group_2020_df': standings_2020}
+    if name not in frames:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    import pandas as pd
+
+    globals()[name] = pd.DataFrame(frames[name])
+    return globals()[name]
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+Champions League Draw Algorithm - on-disk draw store
+
+@author: Sreejith
+"""
+
+import json
+import os
+
+import numpy as np
+
+from .batch import draw_batch
+from .bracket import compile_bracket
+from .draw import DRAW_FUNCTIONS, PROCEDURES, DrawError
+from .exact import DrawProbabilities
+from .stream import DrawResult, draw_result, winner_pairings
+
+
+# draw store
+# keeps every draw of a long simulation on disk, one fixed width row per draw,
+# instead of a matches DataFrame each:
+# - a directory with a file per column, rows in draw order:
+#   pairing.bin  (draws, winners) int8, runner up drawn against each winner,
+#                -1 when the draw got stuck before it
+#   invalid.bin  (draws,) bool, True when the draw got stuck
+#   stuck.bin    (draws,) int8, matches drawn when stuck, -1 for valid draws
+#   seed.bin     (draws,) int64, root seed of the draw, -1 when not known
+#   index.bin    (draws,) int64, index of the draw under its seed: draws of
+#                the draw functions are made with draw_rng(seed, index), batch
+#                draws are row index of a draw_batch from default_rng(seed),
+#                the rows of one draw_batch being consecutive, so either can
+#                be made again (see replay)
+# - meta.json names the clubs and the procedure and counts the rows written
+# - rows are only ever appended, in chunks: a chunk is written to every
+#   column, then meta.json is replaced, so a reader (or a crash) never sees a
+#   partly written chunk
+# - columns are read back as np.memmap views of the files, nothing is copied
+#   until used
+#
+# add and add_batch take a DrawResult or a BatchDraws like DrawAggregator, so
+# the simulation loops can stream into a store, rows are buffered up to
+# chunk_size and written by flush (closing the store, or leaving a with
+# block, flushes)
+STORE_COLUMNS = (('pairing', 'i1'), ('invalid', '?'), ('stuck', 'i1'),
+                 ('seed', '<i8'), ('index', '<i8'))
+
+
+class DrawStore:
+
+    def __init__(self, path, last16_df=None, procedure=None, chunk_size=1 << 16):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.buffer = []
+        self.buffered = 0
+
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+            if last16_df is not None:
+                bracket = compile_bracket(last16_df)
+                if (bracket.winners != self.meta['winners']) | \
+                        (bracket.runners != self.meta['runners']):
+                    raise ValueError("Draw store " + path + " holds other clubs")
+            if (procedure is not None) & (procedure != self.meta['procedure']):
+                raise ValueError("Draw store " + path + " holds " +
+                                 str(self.meta['procedure']) + " draws")
+        else:
+            if last16_df is None:
+                raise ValueError("No draw store at " + path +
+                                 " - give the standings to create one")
+            bracket = compile_bracket(last16_df)
+            os.makedirs(path, exist_ok=True)
+            for name, dtype in STORE_COLUMNS:
+                open(self.column_path(name), 'wb').close()
+            self.meta = {'format': 1, 'winners': bracket.winners,
+                         'runners': bracket.runners, 'procedure': procedure,
+                         'rows': 0, 'chunks': []}
+            self.write_meta()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.meta['rows']
+
+    @property
+    def winners(self):
+        return self.meta['winners']
+
+    @property
+    def runners(self):
+        return self.meta['runners']
+
+    def column_path(self, name):
+        return os.path.join(self.path, name + '.bin')
+
+    def write_meta(self):
+        meta_path = os.path.join(self.path, 'meta.json')
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    # append rows, pairing as (draws, winners) runner up codes
+    def append(self, pairing, invalid, stuck, seed=-1, index=-1):
+        rows = len(invalid)
+        columns = {'pairing': np.asarray(pairing, dtype=np.int8).reshape(
+                       rows, len(self.winners)),
+                   'invalid': np.asarray(invalid, dtype=bool),
+                   'stuck': np.asarray(stuck, dtype=np.int8),
+                   'seed': np.broadcast_to(np.asarray(seed, dtype='<i8'), rows),
+                   'index': np.broadcast_to(np.asarray(index, dtype='<i8'), rows)}
+        self.buffer.append(columns)
+        self.buffered += rows
+        if self.buffered >= self.chunk_size:
+            self.flush()
+
+    def add(self, result, seed=-1, index=-1):
+        self.append([result.pairing], [result.invalid], [result.stuck], seed,
+                    index)
+
+    def add_batch(self, draws, seed=-1):
+        index = np.arange(draws.invalid.size) if seed >= 0 else -1
+        self.append(winner_pairings(draws), draws.invalid, draws.stuck, seed,
+                    index)
+
+    def flush(self):
+        if not self.buffered:
+            return
+
+        rows = self.meta['rows']
+        for name, dtype in STORE_COLUMNS:
+            with open(self.column_path(name), 'r+b') as f:
+                # anything past the rows counted is left from an unfinished
+                # chunk and is written over
+                f.seek(rows * self.row_bytes(name))
+                for columns in self.buffer:
+                    f.write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+
+        self.meta['rows'] = rows + self.buffered
+        self.meta['chunks'].append(self.buffered)
+        self.write_meta()
+        self.buffer = []
+        self.buffered = 0
+
+    def close(self):
+        self.flush()
+
+    def row_bytes(self, name):
+        width = len(self.winners) if name == 'pairing' else 1
+        return width * np.dtype(dict(STORE_COLUMNS)[name]).itemsize
+
+    # read only memmap of a column, rows start to stop
+    def column(self, name, start=0, stop=None):
+        rows = self.meta['rows']
+        stop = rows if stop is None else min(stop, rows)
+        shape = (stop - start, len(self.winners)) if name == 'pairing' else (stop - start,)
+        dtype = dict(STORE_COLUMNS)[name]
+        if stop <= start:
+            return np.empty(shape, dtype=dtype)
+
+        return np.memmap(self.column_path(name), dtype=dtype, mode='r',
+                         offset=start * self.row_bytes(name), shape=shape)
+
+    # draw of a row made again from its seed and index:
+    # - for stores of a draw function, as a DrawState (or the DrawError of an
+    #   invalid draw)
+    # - for stores of a procedure, as a DrawResult, by drawing the whole
+    #   draw_batch the row came from again
+    def replay(self, last16_df, row):
+        if not 0 <= row < self.meta['rows']:
+            raise ValueError("No row " + str(row) + " in draw store " + self.path)
+        seed = int(self.column('seed', row, row + 1)[0])
+        index = int(self.column('index', row, row + 1)[0])
+        if (seed < 0) | (index < 0):
+            raise ValueError("Row " + str(row) + " has no seed and index")
+
+        if self.meta['procedure'] in PROCEDURES:
+            size = self.batch_size(row - index, seed)
+            draws = draw_batch(last16_df, size, self.meta['procedure'],
+                               np.random.default_rng(seed))
+            pairing = winner_pairings(draws)[index]
+
+            return DrawResult(tuple(pairing.tolist()), bool(draws.invalid[index]),
+                              int(draws.stuck[index]))
+
+        draws = {f.__name__: f for f in DRAW_FUNCTIONS.values()}
+        if self.meta['procedure'] not in draws:
+            raise ValueError("Draws of " + str(self.meta['procedure']) +
+                             " cannot be made again")
+        try:
+            return draws[self.meta['procedure']](last16_df, seed, as_frame=False,
+                                                 draw_index=index)
+        except DrawError as e:
+            return e
+
+    # number of rows of the draw_batch starting at row start, the rows that
+    # follow it with its seed and the next indexes
+    def batch_size(self, start, seed, block_size=1 << 16):
+        size = 0
+        while start + size < self.meta['rows']:
+            seeds = self.column('seed', start + size, start + size + block_size)
+            indexes = self.column('index', start + size, start + size + block_size)
+            follow = (seeds == seed) & (indexes == np.arange(size, size + seeds.size))
+            size += int(follow.cumprod().sum())
+            if not follow.all():
+                break
+
+        return size
+
+    # (pairing, invalid, stuck, seed, index) memmaps of consecutive blocks of
+    # rows
+    def blocks(self, size=1 << 20):
+        for start in range(0, self.meta['rows'], size):
+            yield tuple(self.column(name, start, start + size)
+                        for name, dtype in STORE_COLUMNS)
+
+
+# draw n times into a store:
+# - procedure names are drawn with draw_batch in chunks, each from its own
+#   Generator with a seed spawned from the root seed
+# - draw functions are drawn one by one, draw i with draw_rng(seed, i)
+def store_draws(store, last16_df, procedure, n, seed=None, chunk_size=10000):
+    bracket = compile_bracket(last16_df)
+    if not isinstance(store, DrawStore):
+        store = DrawStore(store, bracket,
+                          procedure if procedure in PROCEDURES else procedure.__name__)
+
+    chunks = range(0, n, chunk_size)
+    seeds = np.random.SeedSequence(seed).generate_state(len(chunks) + 1,
+                                                        np.uint64) >> 1
+    root_seed = int(seeds[-1])
+    for start, chunk_seed in zip(chunks, seeds.tolist()):
+        size = min(chunk_size, n - start)
+        if procedure in PROCEDURES:
+            store.add_batch(draw_batch(bracket, size, procedure,
+                                       np.random.default_rng(chunk_seed)),
+                            chunk_seed)
+        else:
+            index = range(start, start + size)
+            results = [draw_result(bracket, procedure, root_seed, i) for i in index]
+            store.append([r.pairing for r in results],
+                         [r.invalid for r in results],
+                         [r.stuck for r in results], root_seed, index)
+    store.flush()
+
+    return store
+
+
+# queries
+# pairing, invalid and stuck frequencies over the draws of a store (or those
+# where the given winner drew the given runner up), block by block, as a
+# DrawProbabilities tuple: pairing over the valid draws, invalid and stuck over
+# all of them
+def pair_frequency(store, block_size=1 << 20):
+    return store_frequency(store, None, block_size)
+
+
+def conditional_frequency(store, winner, runner, block_size=1 << 20):
+    if winner not in store.winners:
+        raise ValueError("Not a group winner: " + str(winner))
+    if runner not in store.runners:
+        raise ValueError("Not a runner up: " + str(runner))
+
+    return store_frequency(
+        store, (store.winners.index(winner), store.runners.index(runner)),
+        block_size)
+
+
+def store_frequency(store, given, block_size):
+    w, m = len(store.winners), len(store.runners)
+    pairing = np.zeros(w * m, dtype=np.int64)
+    stuck = np.zeros(m, dtype=np.int64)
+    draws = 0
+    for block_pairing, invalid, block_stuck, seed, index in store.blocks(block_size):
+        if given is not None:
+            rows = block_pairing[:, given[0]] == given[1]
+            block_pairing, invalid, block_stuck = (
+                block_pairing[rows], invalid[rows], block_stuck[rows])
+
+        draws += invalid.size
+        valid = block_pairing[~invalid]
+        # winners left unpaired (more winners than runners up) are -1
+        pairs = (np.arange(w) * m + valid)[valid >= 0]
+        pairing += np.bincount(pairs, minlength=w * m)
+        stuck += np.bincount(block_stuck[invalid], minlength=m)
+
+    valid = max(draws - int(stuck.sum()), 1)
+    draws_safe = max(draws, 1)
+
+    return DrawProbabilities(pairing.reshape(w, m) / valid,
+                             stuck.sum() / draws_safe, stuck / draws_safe)
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Champions League Draw Algorithm - streaming draws
+
+@author: Sreejith
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from .batch import draw_batch, pairing_counts
+from .bracket import compile_bracket
+from .draw import PROCEDURES, DrawError
+from .exact import DrawProbabilities
+
+
+# streaming draws
+# iter_draws yields one compact DrawResult per draw rather than a DataFrame,
+# and DrawAggregator keeps running totals of any number of them in fixed memory:
+# - pairing: the runner up drawn against each winner (-1 when the draw got stuck)
+# - invalid: True when the draw got stuck
+# - stuck: number of matches drawn when the draw got stuck, -1 for valid draws
+# procedure names are drawn with draw_batch in chunks, draw functions one by one
+DrawResult = namedtuple('DrawResult', ['pairing', 'invalid', 'stuck'])
+
+
+# (n, winners) runner up drawn against each winner in a batch of draws
+def winner_pairings(draws):
+    n, m = draws.winner.shape
+    pairing = np.full((n, m), -1, dtype=np.int8)
+    rows, matches = np.nonzero(draws.winner >= 0)
+    pairing[rows, draws.winner[rows, matches]] = draws.runner[rows, matches]
+
+    return pairing
+
+
+def iter_draws(last16_df, procedure, n=None, rng=None, chunk_size=10000):
+    # n=None keeps drawing until the caller stops
+    bracket = compile_bracket(last16_df)
+    if rng is None:
+        rng = np.random.default_rng()
+
+    drawn = 0
+    while (n is None) or (drawn < n):
+        size = chunk_size if n is None else min(chunk_size, n - drawn)
+        if procedure in PROCEDURES:
+            draws = draw_batch(bracket, size, procedure, rng)
+            for pairing, invalid, stuck in zip(winner_pairings(draws).tolist(),
+                                               draws.invalid.tolist(),
+                                               draws.stuck.tolist()):
+                yield DrawResult(tuple(pairing), invalid, stuck)
+        else:
+            for i in range(size):
+                yield draw_result(bracket, procedure, rng)
+        drawn += size
+
+
+# one draw of a draw function as a DrawResult, draw_index as for the draw
+# functions
+def draw_result(bracket, draw, rng, draw_index=None):
+    pairing = [-1] * len(bracket.winners)
+    try:
+        if draw_index is None:
+            state = draw(bracket, rng, as_frame=False)
+        else:
+            state = draw(bracket, rng, as_frame=False, draw_index=draw_index)
+    except DrawError as e:
+        return DrawResult(tuple(pairing), True, e.matches_drawn)
+
+    for w, r in zip(state.winner.tolist(), state.runner.tolist()):
+        pairing[w] = r
+
+    return DrawResult(tuple(pairing), False, -1)
+
+
+# Wilson score interval of k successes in n trials (0 to 1 when n is 0)
+def wilson_interval(k, n, z=1.96):
+    k = np.asarray(k, dtype=float)
+    n = np.asarray(n, dtype=float)
+    n_safe = np.maximum(n, 1)
+    p = k / n_safe
+
+    centre = (p + z ** 2 / (2 * n_safe)) / (1 + z ** 2 / n_safe)
+    half = (z * np.sqrt(p * (1 - p) / n_safe + z ** 2 / (4 * n_safe ** 2)) /
+            (1 + z ** 2 / n_safe))
+    low = np.where(n > 0, np.maximum(centre - half, 0), 0.0)
+    high = np.where(n > 0, np.minimum(centre + half, 1), 1.0)
+
+    return low, high
+
+
+# running totals of a stream of draws
+# - invalid and stuck rates are over all draws
+# - pairing probabilities are over the valid draws
+class DrawAggregator:
+
+    def __init__(self, winners_n, runners_n, z=1.96):
+        self.z = z
+        self.draws = 0
+        self.pairing = np.zeros((winners_n, runners_n), dtype=np.int64)
+        self.stuck = np.zeros(runners_n, dtype=np.int64)
+
+    @property
+    def invalid(self):
+        return int(self.stuck.sum())
+
+    def add(self, result):
+        self.draws += 1
+        if result.invalid:
+            self.stuck[result.stuck] += 1
+        else:
+            # winners left unpaired (more winners than runners up) are -1
+            for w, r in enumerate(result.pairing):
+                if r >= 0:
+                    self.pairing[w, r] += 1
+
+    def add_batch(self, draws):
+        self.draws += draws.invalid.size
+        self.pairing += pairing_counts(draws, self.pairing.shape[1])
+        self.stuck += np.bincount(draws.stuck[draws.invalid],
+                                  minlength=self.stuck.size)
+
+    def probabilities(self):
+        valid = max(self.draws - self.invalid, 1)
+        draws = max(self.draws, 1)
+
+        return DrawProbabilities(self.pairing / valid, self.invalid / draws,
+                                 self.stuck / draws)
+
+    # (low, high) Wilson intervals of every tracked probability
+    def intervals(self):
+        valid = self.draws - self.invalid
+
+        return DrawProbabilities(wilson_interval(self.pairing, valid, self.z),
+                                 wilson_interval(self.invalid, self.draws, self.z),
+                                 wilson_interval(self.stuck, self.draws, self.z))
+
+    # whether every interval is within tol of its estimate on both sides
+    def converged(self, tol):
+        estimate = self.probabilities()
+        for p, (low, high) in zip(estimate, self.intervals()):
+            if (np.max(p - low) > tol) | (np.max(high - p) > tol):
+                return False
+
+        return True
+
+
+# draw in chunks until every tracked probability is within tol (or max_draws),
+# also appending every draw to store (a DrawStore) if given
+def simulate_until(last16_df, procedure, tol, rng=None, chunk_size=10000,
+                   max_draws=10 ** 7, z=1.96, store=None):
+    bracket = compile_bracket(last16_df)
+    if rng is None:
+        rng = np.random.default_rng()
+
+    aggregator = DrawAggregator(len(bracket.winners), len(bracket.runners), z)
+    while aggregator.draws < max_draws:
+        size = min(chunk_size, max_draws - aggregator.draws)
+        if procedure in PROCEDURES:
+            draws = draw_batch(bracket, size, procedure, rng)
+            aggregator.add_batch(draws)
+            if store is not None:
+                store.add_batch(draws)
+        else:
+            for result in iter_draws(bracket, procedure, size, rng):
+                aggregator.add(result)
+                if store is not None:
+                    store.add(result)
+        if aggregator.converged(tol):
+            break
+    if store is not None:
+        store.flush()
+
+    return aggregator
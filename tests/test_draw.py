@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Champions League Draw Algorithm - draw functions
+
+@author: Sreejith
+"""
+
+import numpy as np
+import pytest
+
+from champions_league.bracket import compile_bracket, mask_bits, select_bit
+from champions_league.draw import DrawError, choice_bit, draw_clubs_order
+from champions_league.endgame import last4_mask
+from champions_league.standings import STANDINGS, synthetic_standings
+
+
+def test_select_bit():
+    rng = np.random.default_rng(0)
+    for _ in range(2000):
+        mask = int(rng.integers(1, 1 << 62)) << int(rng.integers(0, 200))
+        bits = mask_bits(mask)
+        k = int(rng.integers(len(bits)))
+        assert select_bit(mask, k) == bits[k]
+
+
+def test_choice_bit_matches_choice():
+    # the same picks as rng.choice over the set bits, so seeded draws do not
+    # change
+    masks = [0b1, 0b1011, (1 << 255) | (1 << 100) | 0b110, (1 << 256) - 1]
+    for make_rng in (np.random.default_rng, np.random.RandomState):
+        rng, rng_choice = make_rng(3), make_rng(3)
+        for mask in masks * 50:
+            assert choice_bit(mask, rng) == rng_choice.choice(mask_bits(mask))
+
+
+# the order draw rescoring every runner up left from scratch after each match,
+# picking with the same random numbers as draw_clubs_order
+def draw_order_rescored(bracket, rng):
+    winners_left, runners_left = bracket.all_winners, bracket.all_runners
+    pairs = []
+    while runners_left:
+        eli_clubs = {r: (winners_left & bracket.runner_ok[r]).bit_count()
+                     for r in mask_bits(runners_left)}
+        if min(eli_clubs.values()) == 0:
+            return None, len(pairs) - 1 if pairs else 0
+
+        runners_last = last4_mask(bracket, 2, winners_left, runners_left)
+        if runners_last:
+            runner_code = choice_bit(runners_last, rng)
+        else:
+            eli_club_i = min(eli_clubs.values())
+            runner_code = choice_bit(sum(1 << r for r, c in eli_clubs.items()
+                                         if c == eli_club_i), rng)
+        runners_left &= ~(1 << runner_code)
+        winner_code = choice_bit(winners_left & bracket.runner_ok[runner_code], rng)
+        winners_left &= ~(1 << winner_code)
+        pairs.append((winner_code, runner_code))
+
+    return sorted(pairs), -1
+
+
+@pytest.mark.parametrize('standings', ['2021', '2020', 'worst', 'synthetic'])
+def test_order_buckets_match_rescoring(standings):
+    if standings == 'synthetic':
+        bracket = compile_bracket(synthetic_standings(16, seed=2))
+    else:
+        bracket = compile_bracket(STANDINGS[standings])
+
+    for i in range(400):
+        pairs, stuck = draw_order_rescored(bracket, np.random.default_rng(i))
+        try:
+            state = draw_clubs_order(bracket, np.random.default_rng(i),
+                                     as_frame=False)
+        except DrawError as e:
+            assert (pairs, stuck) == (None, e.matches_drawn)
+        else:
+            assert pairs == sorted(zip(state.winner.tolist(),
+                                       state.runner.tolist()))
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Champions League Draw Algorithm - exact, batch and draw function agreement
+
+@author: Sreejith
+"""
+
+import numpy as np
+import pytest
+
+from champions_league.batch import DENSE_MAX_RUNNERS, draw_batch, pairing_counts
+from champions_league.bracket import UNIFORM_MAX_RUNNERS, compile_bracket
+from champions_league.draw import (DRAW_FUNCTIONS, PROCEDURES, DrawError,
+                                   draw_clubs_uniform)
+from champions_league.exact import (draw_bias, draw_probabilities,
+                                    uniform_probabilities)
+from champions_league.standings import STANDINGS, synthetic_standings
+
+
+# the exact probabilities are the limit of the sampled frequencies, so the
+# sampled invalid rate must be within a few standard errors of the exact one
+def assert_close_rate(rate, exact, n, sigmas=5):
+    std_error = np.sqrt(max(exact * (1 - exact), 1 / n) / n)
+    assert abs(rate - exact) <= sigmas * std_error
+
+
+@pytest.mark.parametrize('standings', ['2021', '2020'])
+@pytest.mark.parametrize('procedure', PROCEDURES)
+def test_exact_matches_batch(standings, procedure):
+    n = 100000
+    exact = draw_probabilities(STANDINGS[standings], procedure)
+    draws = draw_batch(STANDINGS[standings], n, procedure,
+                       np.random.default_rng(1))
+
+    assert_close_rate(draws.invalid.mean(), exact.invalid, n)
+    valid = (~draws.invalid).sum()
+    pairing = pairing_counts(draws, 8) / valid
+    assert np.abs(pairing - exact.pairing).max() < 0.01
+    assert np.allclose(exact.pairing.sum(0), 1)
+    assert np.allclose(exact.pairing.sum(1), 1)
+
+
+@pytest.mark.parametrize('procedure', PROCEDURES)
+def test_exact_matches_keyed_batch(procedure):
+    # draws picking by per-club keys, as compare_procedures makes them
+    n = 100000
+    rng = np.random.default_rng(4)
+    exact = draw_probabilities(STANDINGS['2020'], procedure)
+    draws = draw_batch(STANDINGS['2020'], n, procedure, rng,
+                       uniforms=rng.random((n, 8, 2, 8)))
+
+    assert_close_rate(draws.invalid.mean(), exact.invalid, n)
+    pairing = pairing_counts(draws, 8) / (~draws.invalid).sum()
+    assert np.abs(pairing - exact.pairing).max() < 0.01
+
+
+@pytest.mark.parametrize('procedure', PROCEDURES)
+def test_exact_matches_draw_functions(procedure):
+    n = 2000
+    exact = draw_probabilities(STANDINGS['2021'], procedure)
+    rng = np.random.default_rng(2)
+    invalid = 0
+    for _ in range(n):
+        try:
+            DRAW_FUNCTIONS[procedure](STANDINGS['2021'], rng, as_frame=False)
+        except DrawError:
+            invalid += 1
+
+    assert_close_rate(invalid / n, exact.invalid, n)
+
+
+@pytest.mark.parametrize('standings', ['2021', '2020', 'playoff_2025'])
+def test_uniform_matches_generic_solver(standings):
+    uniform = uniform_probabilities(STANDINGS[standings])
+    exact = draw_probabilities(STANDINGS[standings], 'uniform')
+
+    assert np.allclose(uniform.pairing, exact.pairing)
+    assert uniform.invalid == exact.invalid == 0
+
+
+def test_uniform_has_no_bias():
+    bias = draw_bias(STANDINGS['2021'], 'uniform')
+
+    assert bias.max_abs < 1e-12
+    assert bias.total_variation < 1e-12
+
+
+def test_known_invalid_rates():
+    # the rates quoted in cli.run_exact
+    rates = {'random': 0.224, 'country': 0.024, 'country_alt': 0.049,
+             'order': 0.001}
+    for procedure, rate in rates.items():
+        exact = draw_probabilities(STANDINGS['2021'], procedure)
+        assert round(exact.invalid, 3) == rate
+
+
+def test_uniform_draw_function():
+    bracket = compile_bracket(STANDINGS['2020'])
+    rng = np.random.default_rng(5)
+    n = 20000
+    counts = np.zeros((8, 8))
+    for _ in range(n):
+        state = draw_clubs_uniform(bracket, rng, as_frame=False)
+        counts[state.winner, state.runner] += 1
+
+    assert np.abs(counts / n - uniform_probabilities(bracket).pairing).max() < 0.02
+    # only the states of the last runners up are counted, one per set of
+    # winners left
+    assert len(bracket.count_cache) <= 1 << 8
+
+
+def test_runner_limits():
+    large = synthetic_standings(UNIFORM_MAX_RUNNERS + 1, seed=0)
+    with pytest.raises(ValueError):
+        draw_clubs_uniform(large, np.random.default_rng(0))
+    with pytest.raises(ValueError):
+        uniform_probabilities(large)
+    with pytest.raises(ValueError):
+        draw_bias(synthetic_standings(DENSE_MAX_RUNNERS + 1, seed=0), 'order')
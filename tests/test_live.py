@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Champions League Draw Algorithm - live draw service
+
+@author: Sreejith
+"""
+
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+from champions_league.live import LiveDraw, LiveDrawService
+from champions_league.standings import STANDINGS
+
+
+def post_draw(body):
+    service = LiveDrawService(LiveDraw(STANDINGS['2021'], 'order'))
+
+    async def request():
+        try:
+            return await service.respond('POST', '/draw', body)
+        except ValueError as e:
+            # answered with 400 by LiveDrawService.handle
+            return 400, str(e).encode()
+
+    return asyncio.run(request())
+
+
+@pytest.mark.parametrize('body', [b'[1, 2]', b'"Chelsea"', b'{"runner": [1]}',
+                                  b'{"runner": "Chelsea"}', b'not json'])
+def test_bad_draws_are_rejected(body):
+    assert post_draw(body)[0] == 400
+
+
+def test_draw_updates_probabilities():
+    status, payload = post_draw(b'{"runner": "Chelsea", "winner": "Lille OSC"}')
+    probabilities = json.loads(payload)
+
+    assert status == 200
+    assert np.isclose(probabilities['pairing']['Lille OSC']['Chelsea'], 1.0)
+
+
+def test_draws_sent_together_both_count():
+    service = LiveDrawService(LiveDraw(STANDINGS['2021'], 'order'))
+
+    async def requests():
+        return await asyncio.gather(
+            service.respond('POST', '/draw',
+                            b'{"runner": "Chelsea", "winner": "Lille OSC"}'),
+            service.respond('POST', '/draw',
+                            b'{"runner": "Villarreal", "winner": "Manchester City"}'))
+
+    responses = asyncio.run(requests())
+    drawn = json.loads(service.payload)['drawn']
+
+    assert [status for status, payload in responses] == [200, 200]
+    assert sorted(drawn) == [['Chelsea', 'Lille OSC'],
+                             ['Villarreal', 'Manchester City']]
+    assert json.loads(responses[1][1])['drawn'] == drawn
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""
+Champions League Draw Algorithm - process pool simulations
+
+@author: Sreejith
+"""
+
+import numpy as np
+import pytest
+
+from champions_league.parallel import simulate_draws
+from champions_league.standings import STANDINGS
+
+
+# draw i of a run is made from draw_rng(seed, i) wherever it runs, so the
+# totals of a seed do not depend on the workers or how the draws are sharded
+@pytest.mark.parametrize('procedure', ['random', 'country'])
+def test_totals_independent_of_workers(procedure):
+    one = simulate_draws(STANDINGS['2021'], procedure, 1500, seed=11,
+                         workers=1, shard_size=1500)
+    for workers, shard_size in ((2, 100), (2, 333), (3, 1000)):
+        other = simulate_draws(STANDINGS['2021'], procedure, 1500, seed=11,
+                               workers=workers, shard_size=shard_size)
+        assert np.array_equal(one.pairing, other.pairing)
+        assert np.array_equal(one.stuck, other.stuck)
+        assert one.invalid == other.invalid
+
+    assert one.invalid > 0
+    assert one.pairing.sum() == 8 * (1500 - one.invalid)
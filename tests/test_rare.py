@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+Champions League Draw Algorithm - rare invalid draws
+
+@author: Sreejith
+"""
+
+import numpy as np
+import pytest
+
+from champions_league.exact import draw_probabilities
+from champions_league.rare import estimate_invalid
+from champions_league.standings import STANDINGS
+
+
+@pytest.mark.parametrize('standings', ['2021', '2020'])
+@pytest.mark.parametrize('procedure', ['random', 'country', 'country_alt', 'order'])
+def test_whole_tail_is_exact(standings, procedure):
+    # with every match added up, nothing is sampled
+    estimate = estimate_invalid(STANDINGS[standings], procedure, n=10,
+                                rng=np.random.default_rng(0), tail=8)
+    exact = draw_probabilities(STANDINGS[standings], procedure)
+
+    assert np.isclose(estimate.invalid, exact.invalid, rtol=1e-9, atol=1e-12)
+
+
+@pytest.mark.parametrize('standings', ['2021', '2020'])
+@pytest.mark.parametrize('procedure', ['country', 'order'])
+def test_estimate_matches_exact(standings, procedure):
+    estimate = estimate_invalid(STANDINGS[standings], procedure, n=4000,
+                                rng=np.random.default_rng(3))
+    exact = draw_probabilities(STANDINGS[standings], procedure)
+    std_error = (estimate.interval[1] - estimate.interval[0]) / (2 * 1.96)
+
+    assert abs(estimate.invalid - exact.invalid) <= 5 * std_error
+    assert np.isclose(estimate.lost.sum(), estimate.invalid)
+    # fewer draws than plain sampling would need for the same precision
+    assert estimate.naive_draws > 4 * estimate.draws
+
+
+def test_never_stuck_procedures():
+    for procedure in ('lookahead', 'uniform'):
+        estimate = estimate_invalid(STANDINGS['2021'], procedure)
+        assert estimate.invalid == 0
+        assert estimate.interval == (0, 0)
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+Champions League Draw Algorithm - rule variants
+
+@author: Sreejith
+"""
+
+import numpy as np
+import pytest
+
+from champions_league.bracket import compile_bracket
+from champions_league.rules import compile_rules
+from champions_league.standings import STANDINGS
+
+
+def test_forbid_needs_a_winner_and_a_runner_up():
+    with pytest.raises(ValueError):
+        compile_rules(STANDINGS['2021'],
+                      {'forbid': [('Liverpool', 'Manchester City')]})
+    with pytest.raises(ValueError):
+        compile_rules(STANDINGS['2021'], {'forbid': [('Chelsea', 'Atalanta')]})
+
+    # either order
+    for pair in [('Chelsea', 'Lille OSC'), ('Lille OSC', 'Chelsea')]:
+        bracket = compile_rules(STANDINGS['2021'], {'forbid': [pair]})
+        w = bracket.club_code['Lille OSC'][1]
+        r = bracket.club_code['Chelsea'][1]
+        assert not bracket.runner_ok[r] >> w & 1
+
+
+def test_separate_checks_countries():
+    with pytest.raises(ValueError):
+        compile_rules(STANDINGS['2021'], {'separate': [['ENG', 'ESP']]})
+
+    standard = compile_bracket(STANDINGS['2021'])
+    bracket = compile_rules(STANDINGS['2021'], {'separate': [['Eng', 'Esp']]})
+    runner_ok = np.array(bracket.runner_ok)
+    assert (runner_ok & ~np.array(standard.runner_ok) == 0).all()
+    for r in range(len(bracket.runners)):
+        if bracket.countries[bracket.runner_country[r]] == 'Eng':
+            for w in range(len(bracket.winners)):
+                if bracket.countries[bracket.winner_country[w]] == 'Esp':
+                    assert not runner_ok[r] >> w & 1
+    assert (runner_ok != np.array(standard.runner_ok)).any()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Champions League Draw Algorithm - canonical forms and scenario sweeps
+
+@author: Sreejith
+"""
+
+import random
+
+import numpy as np
+import pytest
+
+from champions_league.bracket import compile_bracket
+from champions_league.exact import draw_probabilities
+from champions_league.scenarios import canonical_form, sweep_scenarios
+from champions_league.standings import STANDINGS
+
+
+# the same standings with the rows shuffled and the groups and countries
+# renamed
+def relabelled(standings, seed):
+    rng = random.Random(seed)
+    rows = list(range(len(standings['club'])))
+    rng.shuffle(rows)
+    groups = sorted(set(standings['group']))
+    countries = sorted(set(standings['country']))
+    group_names = dict(zip(groups, rng.sample(range(100), len(groups))))
+    country_names = dict(zip(countries, rng.sample(range(100), len(countries))))
+
+    return {'club': [standings['club'][k] for k in rows],
+            'group': [group_names[standings['group'][k]] for k in rows],
+            'finish': [standings['finish'][k] for k in rows],
+            'country': [country_names[standings['country'][k]] for k in rows]}
+
+
+def test_canonical_form_ignores_relabelling():
+    bracket = compile_bracket(STANDINGS['2021'])
+    signature = canonical_form(bracket)[0]
+    for seed in range(5):
+        other = compile_bracket(relabelled(STANDINGS['2021'], seed))
+        assert canonical_form(other)[0] == signature
+
+    assert canonical_form(compile_bracket(STANDINGS['2020']))[0] != signature
+
+
+def test_canonical_positions_map_probabilities():
+    # pairing probabilities solved for one labelling, moved to the canonical
+    # positions, are those of any other labelling
+    bracket = compile_bracket(STANDINGS['2021'])
+    other = compile_bracket(relabelled(STANDINGS['2021'], 7))
+    signature, winner_pos, runner_pos = canonical_form(bracket)
+    other_signature, other_winner_pos, other_runner_pos = canonical_form(other)
+
+    pairing = draw_probabilities(bracket, 'order').pairing
+    other_pairing = draw_probabilities(other, 'order').pairing
+    canonical = np.zeros_like(pairing)
+    canonical[np.ix_(winner_pos, runner_pos)] = pairing
+    other_canonical = np.zeros_like(pairing)
+    other_canonical[np.ix_(other_winner_pos, other_runner_pos)] = other_pairing
+
+    assert np.allclose(canonical, other_canonical)
+
+
+def test_sweep_matches_direct_solves():
+    sweep = sweep_scenarios(STANDINGS['2021'], 'country', workers=1)
+
+    assert len(sweep.scenarios) == 256
+    assert sweep.solved < len(sweep.scenarios)
+    for scenario in sweep.scenarios[::37]:
+        direct = draw_probabilities(scenario.standings, 'country')
+        assert np.allclose(direct.pairing, scenario.probabilities.pairing)
+        assert np.isclose(direct.invalid, scenario.probabilities.invalid)
+
+
+def test_sweep_needs_groups():
+    with pytest.raises(ValueError):
+        sweep_scenarios(STANDINGS['playoff_2025'], 'order', workers=1)
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Champions League Draw Algorithm - standings files
+
+@author: Sreejith
+"""
+
+import csv
+import json
+import os
+
+import numpy as np
+
+from champions_league.bracket import compile_bracket
+from champions_league.seasons import load_seasons
+from champions_league.standings import STANDINGS
+
+
+def write_csv(path, standings):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(list(standings))
+        writer.writerows(zip(*standings.values()))
+
+
+def test_load_seasons(tmp_path):
+    # 2021 in CSV with misspelt clubs, 2020 in JSON
+    misspelt = {'Manchester City': 'Man City',
+                'Paris Saint-Germain': 'PSG'}
+    standings_2021 = dict(STANDINGS['2021'])
+    standings_2021['club'] = [misspelt.get(c, c) for c in standings_2021['club']]
+    write_csv(str(tmp_path / '2021.csv'), standings_2021)
+    with open(tmp_path / '2020.json', 'w') as f:
+        json.dump(STANDINGS['2020'], f)
+    cache_dir = str(tmp_path / 'cache')
+
+    first = load_seasons(str(tmp_path), cache_dir)
+    assert sorted(first.brackets) == ['2020', '2021']
+    assert first.cached == []
+    assert "Renamed Man City to Manchester City" in first.issues['2021']
+    assert "Renamed PSG to Paris Saint-Germain" in first.issues['2021']
+    expected = compile_bracket(STANDINGS['2021'])
+    assert first.brackets['2021'].winners == expected.winners
+    assert first.brackets['2021'].runner_ok == expected.runner_ok
+
+    # read back from the cache, with the engine tables
+    second = load_seasons(str(tmp_path), cache_dir)
+    assert second.cached == ['2020', '2021']
+    assert second.issues == first.issues
+    for season in ('2020', '2021'):
+        assert second.brackets[season].runner_ok == first.brackets[season].runner_ok
+        assert np.array_equal(second.brackets[season].matching_states,
+                              first.brackets[season].matching_states)
+
+    # a changed file is parsed again, and its old bracket dropped
+    write_csv(str(tmp_path / '2021.csv'), STANDINGS['2021'])
+    third = load_seasons(str(tmp_path), cache_dir)
+    assert third.cached == ['2020']
+    assert third.issues['2021'] == []
+    assert len([name for name in os.listdir(cache_dir)
+                if name.startswith('2021-')]) == 1
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Champions League Draw Algorithm - streamed and stored draws
+
+@author: Sreejith
+"""
+
+import numpy as np
+import pytest
+
+from champions_league.draw import (DrawError, DrawState, draw_clubs,
+                                   draw_clubs_country)
+from champions_league.standings import STANDINGS
+from champions_league.store import pair_frequency, store_draws
+from champions_league.stream import (DrawAggregator, DrawResult, iter_draws,
+                                     simulate_until)
+
+
+# draws streamed from the draw functions, most of them invalid with
+# draw_clubs, write nothing to stdout
+@pytest.mark.parametrize('draw', [draw_clubs, draw_clubs_country])
+def test_streamed_draws_are_silent(draw, capsys, tmp_path):
+    results = list(iter_draws(STANDINGS['2021'], draw, 300,
+                              np.random.default_rng(0)))
+    assert any(result.invalid for result in results)
+
+    simulate_until(STANDINGS['2021'], draw, 1.0, np.random.default_rng(1),
+                   chunk_size=300)
+    store_draws(str(tmp_path / 'draws'), STANDINGS['2021'], draw, 300, seed=2,
+                chunk_size=100)
+
+    assert capsys.readouterr().out == ''
+
+
+@pytest.mark.parametrize('procedure', ['order', draw_clubs_country])
+def test_stored_draws_replay(procedure, tmp_path):
+    store = store_draws(str(tmp_path / 'draws'), STANDINGS['2021'], procedure,
+                        2500, seed=3, chunk_size=1000)
+    pairing = store.column('pairing')
+    invalid = store.column('invalid')
+    for row in (0, 999, 1000, 2499, 1234):
+        replayed = store.replay(STANDINGS['2021'], row)
+        if isinstance(replayed, DrawError):
+            assert invalid[row]
+        elif isinstance(replayed, DrawState):
+            assert not invalid[row]
+            assert sorted(zip(replayed.winner.tolist(), replayed.runner.tolist())) == [
+                (w, int(pairing[row, w])) for w in range(8)]
+        else:
+            assert replayed.pairing == tuple(pairing[row].tolist())
+            assert replayed.invalid == invalid[row]
+
+
+# three group winners for two runners up, one winner is left unpaired
+UNBALANCED = {'club': ['A', 'B', 'C', 'x', 'y'],
+              'group': ['1', '2', '3', '1', '2'],
+              'finish': [1, 1, 1, 2, 2],
+              'country': ['E', 'F', 'G', 'E', 'F']}
+
+
+def test_unbalanced_bracket_aggregates():
+    aggregator = simulate_until(UNBALANCED, draw_clubs, 0.0,
+                                np.random.default_rng(0), chunk_size=500,
+                                max_draws=2000)
+    probabilities = aggregator.probabilities()
+
+    assert aggregator.pairing.sum() == 2 * (aggregator.draws - aggregator.invalid)
+    assert aggregator.pairing[0, 0] == 0
+    assert np.allclose(probabilities.pairing.sum(0), 1)
+
+
+def test_unbalanced_store_frequency(tmp_path):
+    store = store_draws(str(tmp_path / 'draws'), UNBALANCED, draw_clubs, 2000,
+                        seed=5, chunk_size=500)
+    aggregator = DrawAggregator(3, 2)
+    for row in range(len(store)):
+        aggregator.add(DrawResult(tuple(store.column('pairing', row, row + 1)[0]),
+                                  bool(store.column('invalid', row, row + 1)[0]),
+                                  int(store.column('stuck', row, row + 1)[0])))
+    frequency = pair_frequency(store)
+
+    assert np.allclose(frequency.pairing, aggregator.probabilities().pairing)
+    assert np.allclose(frequency.pairing.sum(0), 1)
+    assert frequency.pairing[0, 0] == 0